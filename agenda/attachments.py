@@ -0,0 +1,126 @@
+"""
+Accès paresseux aux fichiers joints des devoirs.
+
+Le rendu des pages n'a besoin que des métadonnées (`attachment_info`, un simple
+stat). Le contenu n'est lu qu'à la demande, par blocs via mmap, et les fichiers
+téléchargés récemment sont gardés dans un cache LRU borné en octets
+(AGENDA_ATTACHMENT_CACHE_MB, 64 Mo par défaut).
+"""
+import mmap
+import os
+import threading
+from collections import OrderedDict
+from pathlib import Path
+from typing import Iterator, NamedTuple, Optional, Tuple
+
+from .storage import BLOBS_DIR
+
+CHUNK_SIZE = 1024 * 1024
+CACHE_MAX_BYTES = int(float(os.environ.get("AGENDA_ATTACHMENT_CACHE_MB", "64")) * 1024 * 1024)
+
+
+class AttachmentInfo(NamedTuple):
+    path: str
+    name: str
+    size: int
+    mtime: float
+    exists: bool
+
+
+def attachment_info(path: str, name: Optional[str] = None) -> AttachmentInfo:
+    """Métadonnées du fichier, sans l'ouvrir."""
+    name = name or os.path.basename(path)
+    try:
+        st = os.stat(path)
+    except OSError:
+        return AttachmentInfo(path, name, 0, 0.0, False)
+    return AttachmentInfo(path, name, st.st_size, st.st_mtime, True)
+
+
+def human_size(size: int) -> str:
+    for unit in ("o", "Ko", "Mo", "Go"):
+        if size < 1024 or unit == "Go":
+            return f"{size:.0f} {unit}" if unit == "o" else f"{size:.1f} {unit}"
+        size /= 1024
+
+
+def iter_chunks(path: str, chunk_size: int = CHUNK_SIZE) -> Iterator[bytes]:
+    """Lit le fichier par blocs de `chunk_size` via un mapping mémoire."""
+    with open(path, "rb") as f:
+        if os.fstat(f.fileno()).st_size == 0:
+            return
+        with mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+            for offset in range(0, len(mm), chunk_size):
+                yield mm[offset:offset + chunk_size]
+
+
+class ByteLRU:
+    """Cache LRU dont la taille est bornée en octets (et non en nombre d'entrées)."""
+
+    def __init__(self, max_bytes: int = CACHE_MAX_BYTES):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self._data: "OrderedDict[Tuple, bytes]" = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key) -> Optional[bytes]:
+        with self._lock:
+            value = self._data.get(key)
+            if value is not None:
+                self._data.move_to_end(key)
+            return value
+
+    def put(self, key, value: bytes):
+        if len(value) > self.max_bytes:
+            return
+        with self._lock:
+            old = self._data.pop(key, None)
+            if old is not None:
+                self.current_bytes -= len(old)
+            self._data[key] = value
+            self.current_bytes += len(value)
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self._data.popitem(last=False)
+                self.current_bytes -= len(evicted)
+
+    def clear(self):
+        with self._lock:
+            self._data.clear()
+            self.current_bytes = 0
+
+
+_cache = ByteLRU()
+
+
+def _is_blob(path: str) -> bool:
+    """Fichier du stockage par contenu (uploads/blobs/<xx>/<sha256>) : contenu immuable."""
+    p = Path(path)
+    return p.parent.parent == BLOBS_DIR and p.name.startswith(p.parent.name)
+
+
+def read_bytes(path: str) -> bytes:
+    """
+    Contenu complet du fichier, pour un téléchargement demandé par l'utilisateur.
+    Un blob est immuable : sa clé de cache est son chemin (donc son sha256), que
+    save_stream ait touché le fichier ou non. Pour les anciens fichiers, la clé
+    inclut taille et date de modification : un fichier remplacé n'est jamais
+    servi périmé.
+    """
+    if _is_blob(path):
+        key = (path,)
+        data = _cache.get(key)
+        if data is not None:
+            return data
+        if not os.path.exists(path):
+            raise FileNotFoundError(path)
+    else:
+        info = attachment_info(path)
+        if not info.exists:
+            raise FileNotFoundError(path)
+        key = (info.path, info.size, info.mtime)
+        data = _cache.get(key)
+        if data is not None:
+            return data
+    data = b"".join(iter_chunks(path))
+    _cache.put(key, data)
+    return data
@@ -0,0 +1,91 @@
+"""
+Cache mémoire des lectures, partagé par toutes les sessions Streamlit du processus.
+
+Chaque entrée est associée à des « sujets » ('evenements', 'messages', ...).
+Les fonctions d'écriture de crud appellent `bump(...)` : le compteur de version
+du sujet augmente et les entrées qui en dépendent deviennent obsolètes. Un TTL
+borne en plus la durée de vie d'une entrée (écritures faites par un autre
+processus, qui n'incrémentent pas nos compteurs).
+
+Seules des valeurs détachées de la session (tuples `*Row`, dicts, bytes)
+doivent être mises en cache.
+"""
+import functools
+import os
+import threading
+import time
+from collections import OrderedDict
+from typing import Dict, Hashable, Tuple
+
+DEFAULT_TTL = float(os.environ.get("AGENDA_CACHE_TTL", "30"))
+MAX_ENTRIES = int(os.environ.get("AGENDA_CACHE_SIZE", "1024"))
+
+
+class ReadCache:
+    def __init__(self, ttl: float = DEFAULT_TTL, max_entries: int = MAX_ENTRIES):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self._versions: Dict[str, int] = {}
+        self._entries: "OrderedDict[Hashable, Tuple[float, Tuple[int, ...], object]]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    def version(self, *topics: str) -> Tuple[int, ...]:
+        with self._lock:
+            return tuple(self._versions.get(t, 0) for t in topics)
+
+    def bump(self, *topics: str):
+        with self._lock:
+            for t in topics:
+                self._versions[t] = self._versions.get(t, 0) + 1
+
+    def get_or_compute(self, key: Hashable, topics: Tuple[str, ...], compute, ttl: float = None):
+        ttl = self.ttl if ttl is None else ttl
+        now = time.monotonic()
+        versions = self.version(*topics)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None and entry[0] > now and entry[1] == versions:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return entry[2]
+            self.misses += 1
+        value = compute()
+        with self._lock:
+            self._entries[key] = (now + ttl, versions, value)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+        return value
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+
+read_cache = ReadCache()
+
+
+def bump(*topics: str):
+    """À appeler après une écriture : invalide les lectures qui dépendent de ces sujets."""
+    read_cache.bump(*topics)
+
+
+def cached_read(*topics: str, ttl: float = None):
+    """
+    Décorateur pour une fonction de lecture `f(db, *args, **kwargs)` : le résultat
+    est mis en cache selon la fonction et ses paramètres (la session `db` est ignorée).
+    Les paramètres doivent être hashables (passer des tuples plutôt que des listes).
+    """
+    def decorator(func):
+        name = f"{func.__module__}.{func.__qualname__}"
+
+        @functools.wraps(func)
+        def wrapper(db, *args, **kwargs):
+            key = (name, args, tuple(sorted(kwargs.items())))
+            return read_cache.get_or_compute(key, topics, lambda: func(db, *args, **kwargs), ttl=ttl)
+
+        wrapper.uncached = func
+        return wrapper
+    return decorator
@@ -1,8 +1,15 @@
-from typing import Optional, List, Generator, Dict
-from sqlalchemy.orm import Session
+from typing import Optional, List, Generator, Dict, NamedTuple, Tuple
+from sqlalchemy import and_, func, or_, text
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session, joinedload
 from .db import (
-    User, Classe, Matiere, Evenement, Devoir, Attendance, Message, SessionLocal, init_db
+    User, Classe, Matiere, Evenement, Devoir, Attendance, Message, SessionLocal,
+    FTS_COLUMNS, FTS_TABLE, search_index_available
 )
+from .periods import group_by_day
+from .mailer import SmtpConfig, enqueue_emails, get_worker
+from .cache import bump, cached_read
+from . import storage
 from passlib.hash import pbkdf2_sha256
 # compat bcrypt handler (optionnel)
 try:
@@ -12,19 +19,121 @@ except Exception:
 
 import datetime
 import os
-import smtplib
-from email.message import EmailMessage
-
-# Initialize DB (safe to call multiple times)
-init_db()
+import re
+
+# ---------- Lignes en lecture seule ----------
+# Tuples détachés de la session : les boucles d'affichage peuvent les lire
+# sans déclencher de chargement paresseux (lazy load) de relations.
+class MatiereRow(NamedTuple):
+    id: int
+    nom: str
+    salle: Optional[str]
+    couleur: Optional[str]
+    professeur_id: Optional[int]
+    professeur: Optional[str]
+    classe_id: Optional[int]
+    classe: Optional[str]
+
+
+class EvenementRow(NamedTuple):
+    id: int
+    matiere_id: int
+    date_debut: datetime.datetime
+    date_fin: datetime.datetime
+    description: Optional[str]
+    salle: Optional[str]
+    matiere_nom: str
+    matiere_salle: Optional[str]
+    matiere_couleur: Optional[str]
+    professeur: Optional[str]
+
+
+class DevoirRow(NamedTuple):
+    id: int
+    matiere_id: int
+    titre: str
+    description: Optional[str]
+    date_remise: Optional[datetime.datetime]
+    file_name: Optional[str]
+    file_path: Optional[str]
+    blob_sha256: Optional[str]
+    file_size: Optional[int]
+    mime_type: Optional[str]
+    matiere_nom: str
+    matiere_couleur: Optional[str]
+    professeur: Optional[str]
+
+
+class MessageRow(NamedTuple):
+    id: int
+    from_user_id: Optional[int]
+    subject: str
+    content: Optional[str]
+    created_at: datetime.datetime
+    read: bool
+
+
+class AttendanceSummary(NamedTuple):
+    # {evenement_id: {'yes': n, 'no': n, 'maybe': n}} et idem pour les devoirs
+    evenements: Dict[int, Dict[str, int]]
+    devoirs: Dict[int, Dict[str, int]]
+
+    def for_evenement(self, evenement_id: int) -> Dict[str, int]:
+        return self.evenements.get(evenement_id) or _empty_counts()
+
+    def for_devoir(self, devoir_id: int) -> Dict[str, int]:
+        return self.devoirs.get(devoir_id) or _empty_counts()
+
+
+class AttendeeRow(NamedTuple):
+    user_id: int
+    username: str
+    full_name: Optional[str]
+    status: str
+
+
+def _matiere_query(db: Session, as_rows: bool = False):
+    if as_rows:
+        return (db.query(Matiere.id, Matiere.nom, Matiere.salle, Matiere.couleur, Matiere.professeur_id,
+                         User.username, Matiere.classe_id, Classe.nom)
+                .outerjoin(User, Matiere.professeur_id == User.id)
+                .outerjoin(Classe, Matiere.classe_id == Classe.id))
+    return db.query(Matiere).options(joinedload(Matiere.professeur_obj), joinedload(Matiere.classe))
+
+
+def _evenement_query(db: Session, as_rows: bool = False):
+    if as_rows:
+        return (db.query(Evenement.id, Evenement.matiere_id, Evenement.date_debut, Evenement.date_fin,
+                         Evenement.description, Evenement.salle, Matiere.nom, Matiere.salle,
+                         Matiere.couleur, User.username)
+                .join(Matiere, Evenement.matiere_id == Matiere.id)
+                .outerjoin(User, Matiere.professeur_id == User.id))
+    return db.query(Evenement).options(joinedload(Evenement.matiere).joinedload(Matiere.professeur_obj))
+
+
+def _devoir_query(db: Session, as_rows: bool = False):
+    if as_rows:
+        return (db.query(Devoir.id, Devoir.matiere_id, Devoir.titre, Devoir.description, Devoir.date_remise,
+                         Devoir.file_name, Devoir.file_path, Devoir.blob_sha256, Devoir.file_size, Devoir.mime_type,
+                         Matiere.nom, Matiere.couleur, User.username)
+                .join(Matiere, Devoir.matiere_id == Matiere.id)
+                .outerjoin(User, Matiere.professeur_id == User.id))
+    return db.query(Devoir).options(joinedload(Devoir.matiere).joinedload(Matiere.professeur_obj))
+
+
+def _fetch(query, row_type=None):
+    if row_type is None:
+        return query.all()
+    return [row_type._make(r) for r in query.all()]
 
 
 # ---------- Users ----------
-def create_user(db: Session, username: str, password: str, role: str, full_name: Optional[str] = None) -> User:
+def create_user(db: Session, username: str, password: str, role: str, full_name: Optional[str] = None, classe_id: Optional[int] = None) -> User:
     hashed = pbkdf2_sha256.hash(password)
-    user = User(username=username, password_hash=hashed, role=role, full_name=full_name)
+    user = User(username=username, password_hash=hashed, role=role, full_name=full_name, classe_id=classe_id)
     db.add(user)
     db.commit()
+    bump("users")
     db.refresh(user)
     return user
 
@@ -61,6 +170,7 @@ def create_classe(db: Session, nom: str, description: str = "") -> Classe:
     classe = Classe(nom=nom, description=description)
     db.add(classe)
     db.commit()
+    bump("classes")
     db.refresh(classe)
     return classe
 
@@ -69,26 +179,62 @@ def list_classes(db: Session) -> List[Classe]:
     return db.query(Classe).order_by(Classe.nom).all()
 
 
+def list_students(db: Session) -> List[User]:
+    return db.query(User).filter(User.role == "student").order_by(User.username).all()
+
+
+def set_user_classe(db: Session, user_id: int, classe_id: Optional[int]) -> bool:
+    """Rattache un élève existant à une classe (None = aucune). Renvoie False si l'élève n'existe pas."""
+    updated = (db.query(User).filter(User.id == user_id, User.role == "student")
+               .update({"classe_id": classe_id}, synchronize_session=False))
+    db.commit()
+    if updated:
+        bump("users")
+    return bool(updated)
+
+
 # ---------- Matières ----------
 def create_matiere(db: Session, nom: str, professeur_id: Optional[int], salle: str, couleur: str, classe_id: Optional[int]) -> Matiere:
     mat = Matiere(nom=nom, professeur_id=professeur_id, salle=salle, couleur=couleur, classe_id=classe_id)
     db.add(mat)
     db.commit()
+    bump("matieres")
     db.refresh(mat)
     return mat
 
 
 def delete_matiere(db: Session, matiere_id: int) -> bool:
-    mat = db.query(Matiere).get(matiere_id)
+    """
+    Supprime la matière avec ses événements, devoirs et réponses, libère les
+    fichiers joints des devoirs et supprime les blobs devenus orphelins.
+    """
+    mat = db.get(Matiere, matiere_id)
     if not mat:
         return False
+    event_ids = db.query(Evenement.id).filter(Evenement.matiere_id == matiere_id)
+    devoir_ids = db.query(Devoir.id).filter(Devoir.matiere_id == matiere_id)
+    blobs = [sha for (sha,) in db.query(Devoir.blob_sha256).filter(Devoir.matiere_id == matiere_id, Devoir.blob_sha256.isnot(None))]
+    db.query(Attendance).filter(or_(Attendance.evenement_id.in_(event_ids), Attendance.devoir_id.in_(devoir_ids))).delete(synchronize_session=False)
+    db.query(Evenement).filter(Evenement.matiere_id == matiere_id).delete(synchronize_session=False)
+    db.query(Devoir).filter(Devoir.matiere_id == matiere_id).delete(synchronize_session=False)
+    for sha in blobs:
+        storage.release(db, sha)
     db.delete(mat)
     db.commit()
+    bump("matieres", "evenements", "devoirs", "attendances")
+    if blobs:
+        storage.gc_orphans(db)
     return True
 
 
-def list_matieres(db: Session) -> List[Matiere]:
-    return db.query(Matiere).order_by(Matiere.nom).all()
+def list_matieres(db: Session, as_rows: bool = False) -> List[Matiere]:
+    """Matières avec professeur et classe chargés d'avance (ou `MatiereRow` si as_rows)."""
+    return _fetch(_matiere_query(db, as_rows).order_by(Matiere.nom), MatiereRow if as_rows else None)
+
+
+def list_matieres_for_professeur(db: Session, professeur_id: int, as_rows: bool = False) -> List[Matiere]:
+    query = _matiere_query(db, as_rows).filter(Matiere.professeur_id == professeur_id).order_by(Matiere.nom)
+    return _fetch(query, MatiereRow if as_rows else None)
 
 
 # ---------- Evenements ----------
@@ -96,68 +242,179 @@ def add_evenement(db: Session, matiere_id: int, date_debut: datetime.datetime, d
     ev = Evenement(matiere_id=matiere_id, date_debut=date_debut, date_fin=date_fin, description=description, creator_id=creator_id, salle=salle)
     db.add(ev)
     db.commit()
+    bump("evenements")
     db.refresh(ev)
     return ev
 
 
-def list_evenements_for_matiere(db: Session, matiere_id: int):
-    return db.query(Evenement).filter(Evenement.matiere_id == matiere_id).order_by(Evenement.date_debut).all()
+# Les fonctions de listing chargent Matiere et professeur dans la même requête ;
+# avec as_rows=True elles renvoient des `EvenementRow` détachés de la session.
+def list_evenements_for_matiere(db: Session, matiere_id: int, as_rows: bool = False):
+    query = _evenement_query(db, as_rows).filter(Evenement.matiere_id == matiere_id).order_by(Evenement.date_debut)
+    return _fetch(query, EvenementRow if as_rows else None)
 
 
-def list_evenements_for_date(db: Session, date: datetime.date):
+def list_evenements_for_date(db: Session, date: datetime.date, as_rows: bool = False):
     start = datetime.datetime.combine(date, datetime.time.min)
     end = datetime.datetime.combine(date, datetime.time.max)
-    return db.query(Evenement).filter(Evenement.date_debut >= start, Evenement.date_debut <= end).order_by(Evenement.date_debut).all()
+    query = _evenement_query(db, as_rows).filter(Evenement.date_debut >= start, Evenement.date_debut <= end).order_by(Evenement.date_debut)
+    return _fetch(query, EvenementRow if as_rows else None)
+
 
+def list_evenements_between(db: Session, start: datetime.datetime, end: datetime.datetime, as_rows: bool = False) -> List[Evenement]:
+    """
+    Événements dont la date de début est dans l'intervalle [start, end).
+    Une seule requête quelle que soit la longueur de la période.
+    """
+    query = _evenement_query(db, as_rows).filter(Evenement.date_debut >= start, Evenement.date_debut < end).order_by(Evenement.date_debut)
+    return _fetch(query, EvenementRow if as_rows else None)
+
+
+def list_evenements_by_day(db: Session, start: datetime.datetime, end: datetime.datetime, as_rows: bool = False) -> Dict[datetime.date, List[Evenement]]:
+    """Comme `list_evenements_between`, regroupés par jour (tous les jours de la période sont présents)."""
+    return group_by_day(list_evenements_between(db, start, end, as_rows=as_rows), start, end)
+
+
+def list_evenements_all(db: Session, as_rows: bool = False):
+    return _fetch(_evenement_query(db, as_rows).order_by(Evenement.date_debut), EvenementRow if as_rows else None)
 
-def list_evenements_all(db: Session):
-    return db.query(Evenement).order_by(Evenement.date_debut).all()
+
+def _search_terms(query: str) -> List[str]:
+    return re.findall(r"\w+", query or "")
+
+
+def search_evenements(db: Session, query: str, limit: int = 20, offset: int = 0, as_rows: bool = False):
+    """
+    Recherche plein texte (matière, professeur, description, salle), triée par
+    pertinence (bm25) et paginée. Chaque mot est cherché comme sous-chaîne
+    ("ath" trouve "Maths") via l'index trigram ; les mots de moins de 3
+    caractères, que cet index ne sait pas chercher, passent par un LIKE sur la
+    même table. Sans FTS5, se rabat sur des LIKE côté SQL.
+    """
+    terms = _search_terms(query)
+    if not terms:
+        return []
+    if search_index_available():
+        long_terms = [t for t in terms if len(t) >= 3]
+        short_terms = [t for t in terms if len(t) < 3]
+        where, params = [], {"limit": limit, "offset": offset}
+        if long_terms:
+            where.append(f"{FTS_TABLE} MATCH :q")
+            params["q"] = " ".join(f'"{t}"' for t in long_terms)
+        for i, t in enumerate(short_terms):
+            where.append("(" + " OR ".join(f"{col} LIKE :t{i}" for col in FTS_COLUMNS) + ")")
+            params[f"t{i}"] = f"%{t}%"
+        # sans MATCH, pas de score bm25 : les derniers événements créés d'abord
+        order = "rank" if long_terms else "rowid DESC"
+        ids = [r[0] for r in db.execute(
+            text(f"SELECT rowid FROM {FTS_TABLE} WHERE {' AND '.join(where)} "
+                 f"ORDER BY {order} LIMIT :limit OFFSET :offset"),
+            params,
+        )]
+    else:
+        haystack = [Matiere.nom, User.username, Evenement.description, Evenement.salle, Matiere.salle]
+        ids_query = (db.query(Evenement.id)
+                     .join(Matiere, Evenement.matiere_id == Matiere.id)
+                     .outerjoin(User, Matiere.professeur_id == User.id))
+        for t in terms:
+            ids_query = ids_query.filter(or_(*[col.ilike(f"%{t}%") for col in haystack]))
+        ids = [r[0] for r in ids_query.order_by(Evenement.date_debut.desc()).limit(limit).offset(offset).all()]
+    if not ids:
+        return []
+    found = _fetch(_evenement_query(db, as_rows).filter(Evenement.id.in_(ids)), EvenementRow if as_rows else None)
+    position = {ev_id: i for i, ev_id in enumerate(ids)}
+    return sorted(found, key=lambda e: position[e.id])
 
 
 # ---------- Devoirs ----------
-def add_devoir(db: Session, matiere_id: int, titre: str, description: str, date_remise: Optional[datetime.datetime], creator_id: Optional[int], file_name: Optional[str] = None, file_path: Optional[str] = None) -> Devoir:
-    d = Devoir(matiere_id=matiere_id, titre=titre, description=description, date_remise=date_remise, creator_id=creator_id, file_name=file_name, file_path=file_path)
+def add_devoir(db: Session, matiere_id: int, titre: str, description: str, date_remise: Optional[datetime.datetime], creator_id: Optional[int], file_name: Optional[str] = None, file_path: Optional[str] = None, stored_file: Optional[storage.StoredFile] = None) -> Devoir:
+    """
+    `stored_file` (issu de storage.save_stream) rattache un fichier du stockage
+    dédupliqué ; son chemin se déduit de blob_sha256 (storage.devoir_file), rien
+    n'est stocké dans file_path.
+    """
+    blob_sha256 = file_size = mime_type = None
+    if stored_file is not None:
+        storage.acquire(db, stored_file)
+        file_path = None
+        blob_sha256 = stored_file.sha256
+        file_size = stored_file.size
+        mime_type = stored_file.mime_type
+    d = Devoir(matiere_id=matiere_id, titre=titre, description=description, date_remise=date_remise, creator_id=creator_id, file_name=file_name, file_path=file_path, blob_sha256=blob_sha256, file_size=file_size, mime_type=mime_type)
     db.add(d)
     db.commit()
+    bump("devoirs")
     db.refresh(d)
     return d
 
 
-def list_devoirs_for_matiere(db: Session, matiere_id: int):
-    return db.query(Devoir).filter(Devoir.matiere_id == matiere_id).order_by(Devoir.date_remise).all()
+def list_devoirs_for_matiere(db: Session, matiere_id: int, as_rows: bool = False):
+    query = _devoir_query(db, as_rows).filter(Devoir.matiere_id == matiere_id).order_by(Devoir.date_remise)
+    return _fetch(query, DevoirRow if as_rows else None)
 
 
-def list_devoirs_all(db: Session) -> List[Devoir]:
-    return db.query(Devoir).order_by(Devoir.date_remise).all()
+def list_devoirs_all(db: Session, as_rows: bool = False) -> List[Devoir]:
+    return _fetch(_devoir_query(db, as_rows).order_by(Devoir.date_remise), DevoirRow if as_rows else None)
 
 
 # ---------- Attendance (RSVP) ----------
-def set_attendance(db: Session, user_id: int, evenement_id: Optional[int], status: str, devoir_id: Optional[int] = None):
+def _upsert_attendances(db: Session, column, rows: List[Dict]):
+    """INSERT ... ON CONFLICT (user_id, <column>) DO UPDATE, en une seule instruction."""
+    stmt = sqlite_insert(Attendance).values(rows)
+    stmt = stmt.on_conflict_do_update(
+        index_elements=[Attendance.user_id, column],
+        set_={"status": stmt.excluded.status, "updated_at": stmt.excluded.updated_at},
+    )
+    db.execute(stmt)
+
+
+def set_attendance(db: Session, user_id: int, evenement_id: Optional[int], status: str, devoir_id: Optional[int] = None) -> Attendance:
     """
     Set attendance for an event or a devoir.
     For events: pass evenement_id and devoir_id=None.
     For devoirs: pass devoir_id and evenement_id=None.
     status in {'yes','no','maybe'}
+
+    Single atomic UPSERT (relies on the unique indexes created by
+    agenda.schema), so concurrent clicks cannot create duplicates.
+    Returns the inserted or updated Attendance row.
     """
     if evenement_id is None and devoir_id is None:
         raise ValueError("Either evenement_id or devoir_id must be provided")
 
-    query = db.query(Attendance).filter(Attendance.user_id == user_id)
+    column = Attendance.evenement_id if evenement_id is not None else Attendance.devoir_id
+    row = {"user_id": user_id, "evenement_id": evenement_id,
+           "devoir_id": devoir_id if evenement_id is None else None,
+           "status": status, "updated_at": datetime.datetime.utcnow()}
+    _upsert_attendances(db, column, [row])
+    db.commit()
+    bump("attendances")
     if evenement_id is not None:
-        query = query.filter(Attendance.evenement_id == evenement_id)
-    else:
-        query = query.filter(Attendance.devoir_id == devoir_id)
+        return get_user_attendance_for_event(db, user_id, evenement_id)
+    return get_user_attendance_for_devoir(db, user_id, devoir_id)
 
-    att = query.first()
-    if att:
-        att.status = status
-        att.updated_at = datetime.datetime.utcnow()
-    else:
-        att = Attendance(user_id=user_id, evenement_id=evenement_id, devoir_id=devoir_id, status=status)
-        db.add(att)
+
+def set_attendance_many(db: Session, user_id: int, event_statuses: Optional[Dict[int, str]] = None, devoir_statuses: Optional[Dict[int, str]] = None) -> int:
+    """
+    Enregistre plusieurs réponses d'un élève ({evenement_id: status} et/ou
+    {devoir_id: status}) : une instruction UPSERT par type, une seule transaction.
+    Renvoie le nombre de réponses écrites.
+    """
+    now = datetime.datetime.utcnow()
+    written = 0
+    if event_statuses:
+        rows = [{"user_id": user_id, "evenement_id": ev_id, "devoir_id": None, "status": st, "updated_at": now}
+                for ev_id, st in event_statuses.items()]
+        _upsert_attendances(db, Attendance.evenement_id, rows)
+        written += len(rows)
+    if devoir_statuses:
+        rows = [{"user_id": user_id, "evenement_id": None, "devoir_id": dv_id, "status": st, "updated_at": now}
+                for dv_id, st in devoir_statuses.items()]
+        _upsert_attendances(db, Attendance.devoir_id, rows)
+        written += len(rows)
     db.commit()
-    db.refresh(att)
-    return att
+    bump("attendances")
+    return written
 
 
 def get_attendance_for_event(db: Session, evenement_id: int) -> List[Attendance]:
@@ -176,56 +433,236 @@ def get_user_attendance_for_devoir(db: Session, user_id: int, devoir_id: int) ->
     return db.query(Attendance).filter(Attendance.user_id == user_id, Attendance.devoir_id == devoir_id).first()
 
 
+def get_user_attendance_map(db: Session, user_id: int, event_ids: Optional[List[int]] = None, devoir_ids: Optional[List[int]] = None) -> Dict[int, str]:
+    """
+    Réponses d'un utilisateur pour plusieurs événements OU plusieurs devoirs,
+    en une seule requête : {evenement_id (ou devoir_id): status}.
+    """
+    if (event_ids is None) == (devoir_ids is None):
+        raise ValueError("Exactly one of event_ids or devoir_ids must be provided")
+    column = Attendance.evenement_id if event_ids is not None else Attendance.devoir_id
+    ids = list(event_ids if event_ids is not None else devoir_ids)
+    if not ids:
+        return {}
+    rows = db.query(column, Attendance.status).filter(Attendance.user_id == user_id, column.in_(ids)).all()
+    return {target_id: status for target_id, status in rows}
+
+
+def _empty_counts() -> Dict[str, int]:
+    return {"yes": 0, "no": 0, "maybe": 0}
+
+
+def get_attendance_counts_for_professeur(db: Session, professeur_id: int) -> AttendanceSummary:
+    """
+    Compte des réponses par événement et par devoir pour toutes les matières
+    d'un professeur, en une seule requête GROUP BY.
+    """
+    rows = (db.query(Attendance.evenement_id, Attendance.devoir_id, Attendance.status, func.count(Attendance.id))
+            .outerjoin(Evenement, Attendance.evenement_id == Evenement.id)
+            .outerjoin(Devoir, Attendance.devoir_id == Devoir.id)
+            .join(Matiere, Matiere.id == func.coalesce(Evenement.matiere_id, Devoir.matiere_id))
+            .filter(Matiere.professeur_id == professeur_id)
+            .group_by(Attendance.evenement_id, Attendance.devoir_id, Attendance.status)
+            .all())
+    summary = AttendanceSummary(evenements={}, devoirs={})
+    for evenement_id, devoir_id, status, count in rows:
+        if evenement_id is not None:
+            counts = summary.evenements.setdefault(evenement_id, _empty_counts())
+        else:
+            counts = summary.devoirs.setdefault(devoir_id, _empty_counts())
+        counts[status] = counts.get(status, 0) + count
+    return summary
+
+
+def list_attendees(db: Session, evenement_id: Optional[int] = None, devoir_id: Optional[int] = None) -> List[AttendeeRow]:
+    """Réponses détaillées (avec le nom de l'élève) pour un événement ou un devoir, via une jointure."""
+    if evenement_id is None and devoir_id is None:
+        raise ValueError("Either evenement_id or devoir_id must be provided")
+    query = db.query(User.id, User.username, User.full_name, Attendance.status).join(Attendance, Attendance.user_id == User.id)
+    if evenement_id is not None:
+        query = query.filter(Attendance.evenement_id == evenement_id)
+    else:
+        query = query.filter(Attendance.devoir_id == devoir_id)
+    return [AttendeeRow._make(r) for r in query.order_by(User.username).all()]
+
+
 # ---------- Messages / Notifications ----------
 def create_message(db: Session, to_user_id: int, subject: str, content: str, from_user_id: Optional[int] = None) -> Message:
     msg = Message(to_user_id=to_user_id, from_user_id=from_user_id, subject=subject, content=content, created_at=datetime.datetime.utcnow(), read=False)
     db.add(msg)
     db.commit()
+    bump("messages")
     db.refresh(msg)
     return msg
 
 
-def list_messages_for_user(db: Session, user_id: int) -> List[Message]:
-    return db.query(Message).filter(Message.to_user_id == user_id).order_by(Message.created_at.desc()).all()
+def message_cursor(message) -> Tuple[datetime.datetime, int]:
+    """Curseur de pagination (keyset) à passer en `before=` pour obtenir la page suivante."""
+    return (message.created_at, message.id)
+
+
+def list_messages_for_user(db: Session, user_id: int, as_rows: bool = False, before: Optional[Tuple[datetime.datetime, int]] = None, limit: Optional[int] = None) -> List[Message]:
+    """
+    Messages reçus, du plus récent au plus ancien. Avec `before` (voir
+    `message_cursor`) et `limit`, renvoie la page qui suit ce curseur sans
+    relire les pages précédentes (index (to_user_id, created_at)).
+    """
+    if as_rows:
+        query = db.query(Message.id, Message.from_user_id, Message.subject, Message.content, Message.created_at, Message.read)
+    else:
+        query = db.query(Message)
+    query = query.filter(Message.to_user_id == user_id)
+    if before is not None:
+        created_at, message_id = before
+        query = query.filter(or_(Message.created_at < created_at,
+                                 and_(Message.created_at == created_at, Message.id < message_id)))
+    query = query.order_by(Message.created_at.desc(), Message.id.desc())
+    if limit is not None:
+        query = query.limit(limit)
+    return _fetch(query, MessageRow if as_rows else None)
+
+
+def count_unread(db: Session, user_id: int) -> int:
+    """Nombre de notifications non lues, sans charger les messages (index (to_user_id, read))."""
+    return db.query(func.count(Message.id)).filter(Message.to_user_id == user_id, Message.read == False).scalar()  # noqa: E712
 
 
 def mark_message_read(db: Session, message_id: int):
-    msg = db.query(Message).get(message_id)
-    if msg:
-        msg.read = True
-        db.commit()
-        db.refresh(msg)
+    updated = db.query(Message).filter(Message.id == message_id).update({"read": True}, synchronize_session=False)
+    db.commit()
+    if updated:
+        bump("messages")
         return True
     return False
 
 
-def notify_students(db: Session, subject: str, content: str, from_user_id: Optional[int] = None):
+def _user_messages_query(db: Session, user_id: int, ids: Optional[List[int]] = None, before: Optional[datetime.datetime] = None):
+    query = db.query(Message).filter(Message.to_user_id == user_id)
+    if ids is not None:
+        query = query.filter(Message.id.in_(list(ids)))
+    if before is not None:
+        query = query.filter(Message.created_at < before)
+    return query
+
+
+def mark_messages_read(db: Session, user_id: int, ids: Optional[List[int]] = None, before: Optional[datetime.datetime] = None) -> int:
     """
-    Create internal messages (and optionally send email) to all students.
+    Marque comme lus, en un seul UPDATE, les messages de l'utilisateur :
+    tous par défaut, ou seulement `ids` et/ou ceux créés avant `before`.
+    Renvoie le nombre de messages modifiés.
     """
-    students = db.query(User).filter(User.role == "student").all()
-    for s in students:
-        create_message(db, s.id, subject, content, from_user_id=from_user_id)
-        # try to send email if SMTP settings provided
+    if ids is not None and not ids:
+        return 0
+    updated = (_user_messages_query(db, user_id, ids, before)
+               .filter(Message.read == False)  # noqa: E712
+               .update({"read": True}, synchronize_session=False))
+    db.commit()
+    bump("messages")
+    return updated
+
+
+def delete_messages(db: Session, user_id: int, ids: Optional[List[int]] = None, before: Optional[datetime.datetime] = None, only_read: bool = False) -> int:
+    """Supprime en un seul DELETE les messages de l'utilisateur (mêmes filtres que `mark_messages_read`)."""
+    if ids is not None and not ids:
+        return 0
+    query = _user_messages_query(db, user_id, ids, before)
+    if only_read:
+        query = query.filter(Message.read == True)  # noqa: E712
+    deleted = query.delete(synchronize_session=False)
+    db.commit()
+    bump("messages")
+    return deleted
+
+
+def _audience_query(db: Session, classe_id: Optional[int] = None, matiere_id: Optional[int] = None):
+    """
+    Élèves ciblés par une notification : tous les élèves, ceux d'une classe,
+    ou ceux de la classe d'une matière (tous si la matière n'a pas de classe).
+    Les élèves sans classe (classe_id NULL, ex. comptes antérieurs à la colonne)
+    restent dans toutes les audiences : sinon ils ne recevraient plus rien dès
+    qu'une matière est rattachée à une classe.
+    """
+    query = db.query(User.id, User.username).filter(User.role == "student")
+    if matiere_id is not None and classe_id is None:
+        classe_id = db.query(Matiere.classe_id).filter(Matiere.id == matiere_id).scalar()
+    if classe_id is not None:
+        query = query.filter(or_(User.classe_id == classe_id, User.classe_id.is_(None)))
+    return query
+
+
+def create_messages_bulk(db: Session, to_user_ids: List[int], subject: str, content: str, from_user_id: Optional[int] = None) -> int:
+    """Insère un message par destinataire en un seul executemany / une seule transaction."""
+    if not to_user_ids:
+        return 0
+    now = datetime.datetime.utcnow()
+    rows = [
+        {"to_user_id": uid, "from_user_id": from_user_id, "subject": subject, "content": content, "created_at": now, "read": False}
+        for uid in to_user_ids
+    ]
+    db.execute(Message.__table__.insert(), rows)
+    db.commit()
+    bump("messages")
+    return len(rows)
+
+
+def notify_students(db: Session, subject: str, content: str, from_user_id: Optional[int] = None, classe_id: Optional[int] = None, matiere_id: Optional[int] = None) -> int:
+    """
+    Create internal messages (and optionally queue emails) for the targeted students:
+    all students by default, one classe (classe_id) or one matière's students (matiere_id).
+    Returns the number of messages written.
+    """
+    students = _audience_query(db, classe_id=classe_id, matiere_id=matiere_id).all()
+    written = create_messages_bulk(db, [s.id for s in students], subject, content, from_user_id=from_user_id)
+    # e-mails : mis en file dans l'outbox, envoyés par le worker en arrière-plan
+    if SmtpConfig.from_env().enabled:
         try:
-            smtp_host = os.environ.get("SMTP_HOST")
-            smtp_port = int(os.environ.get("SMTP_PORT", "0") or 0)
-            smtp_user = os.environ.get("SMTP_USER")
-            smtp_pass = os.environ.get("SMTP_PASS")
-            from_addr = os.environ.get("SMTP_FROM", "no-reply@example.com")
-            if smtp_host and smtp_port and smtp_user and smtp_pass:
-                # send basic email (blocking)
-                em = EmailMessage()
-                em["Subject"] = subject
-                em["From"] = from_addr
-                em["To"] = s.username  # assumes username is email if you use SMTP
-                em.set_content(content)
-                with smtplib.SMTP_SSL(smtp_host, smtp_port) as smtp:
-                    smtp.login(smtp_user, smtp_pass)
-                    smtp.send_message(em)
+            # assumes username is email if you use SMTP
+            enqueue_emails(db, [s.username for s in students], subject, content)
+            if os.environ.get("AGENDA_EMAIL_WORKER", "1") != "0":
+                get_worker().wake()
         except Exception:
             # swallow exceptions — internal messages still created
             pass
+    return written
+
+
+# ---------- Lectures en cache ----------
+# Versions mises en cache (agenda.cache) des lectures faites à chaque rerun
+# Streamlit. Elles renvoient des lignes détachées ; les écritures ci-dessus
+# appellent bump() sur les sujets concernés pour les invalider.
+@cached_read("matieres", "users", "classes")
+def cached_matieres(db: Session) -> List[MatiereRow]:
+    return list_matieres(db, as_rows=True)
+
+
+@cached_read("evenements", "matieres", "users")
+def cached_evenements_by_day(db: Session, start: datetime.datetime, end: datetime.datetime) -> Dict[datetime.date, List[EvenementRow]]:
+    return list_evenements_by_day(db, start, end, as_rows=True)
+
+
+@cached_read("evenements", "matieres", "users")
+def cached_evenements_for_matiere(db: Session, matiere_id: int) -> List[EvenementRow]:
+    return list_evenements_for_matiere(db, matiere_id, as_rows=True)
+
+
+@cached_read("devoirs", "matieres", "users")
+def cached_devoirs_for_matiere(db: Session, matiere_id: int) -> List[DevoirRow]:
+    return list_devoirs_for_matiere(db, matiere_id, as_rows=True)
+
+
+@cached_read("attendances")
+def cached_attendance_map(db: Session, user_id: int, event_ids: Optional[tuple] = None, devoir_ids: Optional[tuple] = None) -> Dict[int, str]:
+    return get_user_attendance_map(db, user_id, event_ids=event_ids, devoir_ids=devoir_ids)
+
+
+@cached_read("messages")
+def cached_messages(db: Session, user_id: int, before: Optional[Tuple[datetime.datetime, int]] = None, limit: Optional[int] = None) -> List[MessageRow]:
+    return list_messages_for_user(db, user_id, as_rows=True, before=before, limit=limit)
+
+
+@cached_read("messages")
+def cached_unread_count(db: Session, user_id: int) -> int:
+    return count_unread(db, user_id)
 
 
 # Helper to get DB session (use with `with` pattern in app)
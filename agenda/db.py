@@ -1,15 +1,60 @@
 from sqlalchemy import (
-    create_engine, Column, Integer, String, DateTime, ForeignKey, Text, Boolean
+    create_engine, event, Column, Integer, String, DateTime, ForeignKey, Text, Boolean, Index, text
 )
+from sqlalchemy.exc import OperationalError
 from sqlalchemy.orm import declarative_base, relationship, sessionmaker
 import datetime
+import os
+import sqlite3
 from pathlib import Path
 
 BASE_DIR = Path(__file__).resolve().parents[1]
 DB_PATH = BASE_DIR / "agenda.db"
-DATABASE_URL = f"sqlite:///{DB_PATH}"
+DATABASE_URL = os.environ.get("AGENDA_DATABASE_URL", f"sqlite:///{DB_PATH}")
 
-engine = create_engine(DATABASE_URL, connect_args={"check_same_thread": False})
+# Profils de réglage SQLite, appliqués à chaque nouvelle connexion.
+# Choisi via AGENDA_DB_PROFILE ('wal' par défaut, 'legacy' = aucun PRAGMA).
+ENGINE_PROFILES = {
+    "legacy": {},
+    "wal": {
+        "journal_mode": "WAL",          # les lecteurs ne bloquent plus l'écrivain (et inversement)
+        "synchronous": "NORMAL",        # sûr en WAL, évite un fsync par commit
+        "busy_timeout": 5000,           # attend 5 s au lieu d'échouer avec "database is locked"
+        "mmap_size": 256 * 1024 * 1024,
+        "cache_size": -32000,           # ~32 Mo (valeur négative = en Kio)
+        "temp_store": "MEMORY",
+    },
+}
+DEFAULT_PROFILE = "wal"
+
+
+def _apply_pragmas(pragmas):
+    def on_connect(dbapi_conn, _record):
+        cur = dbapi_conn.cursor()
+        try:
+            for name, value in pragmas.items():
+                cur.execute(f"PRAGMA {name}={value}")
+        finally:
+            cur.close()
+    return on_connect
+
+
+def make_engine(url: str = DATABASE_URL, profile: str = None):
+    """Crée un engine SQLAlchemy avec les PRAGMA du profil donné (ou de AGENDA_DB_PROFILE)."""
+    profile = profile or os.environ.get("AGENDA_DB_PROFILE", DEFAULT_PROFILE)
+    if profile not in ENGINE_PROFILES:
+        raise ValueError(f"Unknown AGENDA_DB_PROFILE {profile!r} (expected one of {sorted(ENGINE_PROFILES)})")
+    pragmas = ENGINE_PROFILES[profile]
+    connect_args = {"check_same_thread": False}
+    if "busy_timeout" in pragmas:
+        connect_args["timeout"] = pragmas["busy_timeout"] / 1000
+    eng = create_engine(url, connect_args=connect_args)
+    if pragmas:
+        event.listen(eng, "connect", _apply_pragmas(pragmas))
+    return eng
+
+
+engine = make_engine()
 SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 
 Base = declarative_base()
@@ -17,12 +62,18 @@ Base = declarative_base()
 
 class User(Base):
     __tablename__ = "users"
+    __table_args__ = (
+        Index("ix_users_role_classe", "role", "classe_id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     username = Column(String, unique=True, index=True, nullable=False)
     password_hash = Column(String, nullable=False)
     role = Column(String, nullable=False)  # 'admin' | 'prof' | 'student'
     full_name = Column(String, nullable=True)
+    # classe de l'élève (utilisée pour cibler les notifications)
+    classe_id = Column(Integer, ForeignKey("classes.id"), nullable=True)
 
+    classe = relationship("Classe", back_populates="eleves")
     prof_matieres = relationship("Matiere", back_populates="professeur_obj")
     created_events = relationship("Evenement", back_populates="creator")
     created_devoirs = relationship("Devoir", back_populates="creator")
@@ -38,10 +89,14 @@ class Classe(Base):
     description = Column(Text, nullable=True)
 
     matieres = relationship("Matiere", back_populates="classe")
+    eleves = relationship("User", back_populates="classe")
 
 
 class Matiere(Base):
     __tablename__ = "matieres"
+    __table_args__ = (
+        Index("ix_matieres_professeur_id", "professeur_id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     nom = Column(String, nullable=False)
     professeur_id = Column(Integer, ForeignKey("users.id"), nullable=True)
@@ -57,6 +112,10 @@ class Matiere(Base):
 
 class Evenement(Base):
     __tablename__ = "evenements"
+    __table_args__ = (
+        Index("ix_evenements_date_debut", "date_debut"),
+        Index("ix_evenements_matiere_date", "matiere_id", "date_debut"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     matiere_id = Column(Integer, ForeignKey("matieres.id"), nullable=False)
     date_debut = Column(DateTime, nullable=False)
@@ -73,6 +132,9 @@ class Evenement(Base):
 
 class Devoir(Base):
     __tablename__ = "devoirs"
+    __table_args__ = (
+        Index("ix_devoirs_matiere_date_remise", "matiere_id", "date_remise"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     matiere_id = Column(Integer, ForeignKey("matieres.id"), nullable=False)
     titre = Column(String, nullable=False)
@@ -82,14 +144,36 @@ class Devoir(Base):
 
     # informations du fichier attaché
     file_name = Column(String, nullable=True)  # nom d'origine du fichier
-    file_path = Column(String, nullable=True)  # chemin local où est stocké le fichier
+    file_path = Column(String, nullable=True)  # anciens fichiers seulement ; sinon déduit de blob_sha256
+    # empreinte du contenu dans le stockage dédupliqué (agenda.storage)
+    blob_sha256 = Column(String(64), ForeignKey("blobs.sha256"), nullable=True)
+    file_size = Column(Integer, nullable=True)  # en octets, pour éviter un stat au rendu
+    mime_type = Column(String, nullable=True)
 
     matiere = relationship("Matiere", back_populates="devoirs")
     creator = relationship("User", back_populates="created_devoirs")
 
 
+class Blob(Base):
+    """Fichier stocké une seule fois, identifié par le SHA-256 de son contenu."""
+    __tablename__ = "blobs"
+    sha256 = Column(String(64), primary_key=True)
+    path = Column(String, nullable=False)
+    size = Column(Integer, nullable=False)
+    refcount = Column(Integer, nullable=False, default=0)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+
+
 class Attendance(Base):
     __tablename__ = "attendances"
+    # une seule réponse par (élève, événement) et par (élève, devoir) ;
+    # les NULL étant distincts en SQLite, les deux contraintes cohabitent.
+    __table_args__ = (
+        Index("uq_attendances_user_evenement", "user_id", "evenement_id", unique=True),
+        Index("uq_attendances_user_devoir", "user_id", "devoir_id", unique=True),
+        Index("ix_attendances_evenement_id", "evenement_id"),
+        Index("ix_attendances_devoir_id", "devoir_id"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     evenement_id = Column(Integer, ForeignKey("evenements.id"), nullable=True)
@@ -103,6 +187,10 @@ class Attendance(Base):
 
 class Message(Base):
     __tablename__ = "messages"
+    __table_args__ = (
+        Index("ix_messages_to_user_created", "to_user_id", "created_at"),
+        Index("ix_messages_to_user_read", "to_user_id", "read"),
+    )
     id = Column(Integer, primary_key=True, index=True)
     to_user_id = Column(Integer, ForeignKey("users.id"), nullable=False)
     from_user_id = Column(Integer, ForeignKey("users.id"), nullable=True)
@@ -115,5 +203,96 @@ class Message(Base):
     from_user = relationship("User", back_populates="messages_sent", foreign_keys=[from_user_id])
 
 
+class EmailOutbox(Base):
+    """File d'attente persistante des e-mails (envoyés par agenda.mailer en arrière-plan)."""
+    __tablename__ = "email_outbox"
+    id = Column(Integer, primary_key=True, index=True)
+    to_addr = Column(String, nullable=False)
+    subject = Column(String, nullable=False)
+    content = Column(Text, nullable=True)
+    status = Column(String, nullable=False, default="pending", index=True)  # 'pending' | 'sending' | 'sent' | 'failed'
+    attempts = Column(Integer, nullable=False, default=0)
+    next_attempt_at = Column(DateTime, default=datetime.datetime.utcnow)
+    last_error = Column(Text, nullable=True)
+    created_at = Column(DateTime, default=datetime.datetime.utcnow)
+    sent_at = Column(DateTime, nullable=True)
+    claimed_at = Column(DateTime, nullable=True)  # passage à 'sending' (bail du worker)
+
+
+# ---------- Index plein texte (FTS5) ----------
+# Une ligne par événement (rowid = evenements.id) avec le texte dénormalisé de la
+# matière, du professeur, de la description et de la salle. Les triggers gardent
+# l'index à jour quelle que soit la façon dont les tables sont modifiées.
+# Tokenizer trigram : recherche de sous-chaînes ("glais" trouve "Anglais") ;
+# il ignore les accents à partir de SQLite 3.45 seulement.
+FTS_TABLE = "evenements_fts"
+FTS_COLUMNS = ("matiere", "professeur", "description", "salle")
+FTS_TOKENIZE = "trigram remove_diacritics 1" if sqlite3.sqlite_version_info >= (3, 45, 0) else "trigram"
+
+_FTS_SELECT = """
+    SELECT e.id, m.nom, COALESCE(u.username, ''), COALESCE(e.description, ''), COALESCE(e.salle, m.salle, '')
+    FROM evenements e
+    JOIN matieres m ON m.id = e.matiere_id
+    LEFT JOIN users u ON u.id = m.professeur_id
+"""
+
+_FTS_DDL = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {FTS_TABLE} USING fts5(
+        matiere, professeur, description, salle,
+        tokenize = '{FTS_TOKENIZE}'
+    )""",
+    f"""CREATE TRIGGER IF NOT EXISTS evenements_fts_ai AFTER INSERT ON evenements BEGIN
+        INSERT INTO {FTS_TABLE}(rowid, matiere, professeur, description, salle) {_FTS_SELECT} WHERE e.id = new.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS evenements_fts_au AFTER UPDATE ON evenements BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+        INSERT INTO {FTS_TABLE}(rowid, matiere, professeur, description, salle) {_FTS_SELECT} WHERE e.id = new.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS evenements_fts_ad AFTER DELETE ON evenements BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid = old.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS matieres_fts_au AFTER UPDATE OF nom, salle, professeur_id ON matieres BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid IN (SELECT id FROM evenements WHERE matiere_id = new.id);
+        INSERT INTO {FTS_TABLE}(rowid, matiere, professeur, description, salle) {_FTS_SELECT} WHERE e.matiere_id = new.id;
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS users_fts_au AFTER UPDATE OF username ON users BEGIN
+        DELETE FROM {FTS_TABLE} WHERE rowid IN (
+            SELECT e.id FROM evenements e JOIN matieres m ON m.id = e.matiere_id WHERE m.professeur_id = new.id);
+        INSERT INTO {FTS_TABLE}(rowid, matiere, professeur, description, salle) {_FTS_SELECT} WHERE m.professeur_id = new.id;
+    END""",
+]
+
+# False si la version de SQLite n'a pas FTS5 : la recherche se rabat alors sur LIKE.
+fts_available = False
+
+
+def search_index_available() -> bool:
+    return fts_available
+
+
+def rebuild_search_index(conn):
+    conn.execute(text(f"DELETE FROM {FTS_TABLE}"))
+    conn.execute(text(f"INSERT INTO {FTS_TABLE}(rowid, matiere, professeur, description, salle) {_FTS_SELECT}"))
+
+
+def init_search_index():
+    global fts_available
+    try:
+        with engine.begin() as conn:
+            existed = conn.execute(
+                text("SELECT 1 FROM sqlite_master WHERE type='table' AND name=:n"), {"n": FTS_TABLE}
+            ).first() is not None
+            for ddl in _FTS_DDL:
+                conn.execute(text(ddl))
+            if not existed:
+                rebuild_search_index(conn)
+        fts_available = True
+    except OperationalError as exc:
+        print("Index FTS5 indisponible:", exc)
+        fts_available = False
+
+
 def init_db():
-    Base.metadata.create_all(bind=engine)
\ No newline at end of file
+    """Met le schéma à jour (voir agenda.schema) ; une seule requête si la base est déjà à jour."""
+    from .schema import upgrade
+    upgrade()
\ No newline at end of file
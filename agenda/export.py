@@ -0,0 +1,145 @@
+"""
+Export de l'emploi du temps en CSV ou iCalendar (.ics).
+
+Rien n'est calculé au rendu de la page : l'export est généré à la demande, en
+parcourant les événements par lots depuis le curseur SQL (`yield_per`), avec
+filtres par période et par classe. Le résultat ne dépend que de ces
+paramètres (pas de l'utilisateur) : il est partagé par toutes les sessions,
+dans un cache LRU borné en octets (AGENDA_EXPORT_CACHE_MB, 16 Mo par défaut),
+et regénéré seulement si les événements ou matières ont changé (compteurs de
+version de agenda.cache).
+"""
+import csv
+import datetime
+import io
+import os
+import time
+from typing import Iterator, Optional
+
+from sqlalchemy.orm import Session
+
+from . import crud
+from .attachments import ByteLRU
+from .cache import read_cache
+from .db import Evenement, Matiere
+
+CSV_HEADER = ["Matière", "Professeur", "Salle", "Date Début", "Date Fin", "Description"]
+FORMATS = {
+    "csv": ("text/csv", "emploi_du_temps.csv"),
+    "ics": ("text/calendar", "emploi_du_temps.ics"),
+}
+BATCH_SIZE = 500
+CACHE_TOPICS = ("evenements", "matieres", "users")
+CACHE_MAX_BYTES = int(float(os.environ.get("AGENDA_EXPORT_CACHE_MB", "16")) * 1024 * 1024)
+
+_cache = ByteLRU(CACHE_MAX_BYTES)
+
+
+def iter_evenements(db: Session, start: Optional[datetime.datetime] = None, end: Optional[datetime.datetime] = None,
+                    classe_id: Optional[int] = None) -> Iterator[crud.EvenementRow]:
+    """Événements de la période [start, end) (et de la classe), lus par lots de BATCH_SIZE."""
+    query = crud._evenement_query(db, as_rows=True)
+    if start is not None:
+        query = query.filter(Evenement.date_debut >= start)
+    if end is not None:
+        query = query.filter(Evenement.date_debut < end)
+    if classe_id is not None:
+        query = query.filter(Matiere.classe_id == classe_id)
+    for row in query.order_by(Evenement.date_debut).yield_per(BATCH_SIZE):
+        yield crud.EvenementRow._make(row)
+
+
+def iter_csv(rows) -> Iterator[bytes]:
+    buf = io.StringIO()
+    writer = csv.writer(buf, lineterminator="\n")
+    writer.writerow(CSV_HEADER)
+    for e in rows:
+        writer.writerow([
+            e.matiere_nom,
+            e.professeur or "",
+            e.salle or e.matiere_salle or "",
+            e.date_debut.strftime("%Y-%m-%d %H:%M"),
+            e.date_fin.strftime("%Y-%m-%d %H:%M"),
+            e.description or "",
+        ])
+        yield buf.getvalue().encode("utf-8")
+        buf.seek(0)
+        buf.truncate()
+    if buf.tell():
+        yield buf.getvalue().encode("utf-8")
+
+
+def _ics_escape(value: str) -> str:
+    return (value.replace("\\", "\\\\").replace(";", "\\;").replace(",", "\\,")
+            .replace("\r\n", "\\n").replace("\n", "\\n"))
+
+
+def _ics_fold(line: str) -> str:
+    """Replie les lignes de plus de 75 octets (RFC 5545 §3.1)."""
+    encoded = line.encode("utf-8")
+    if len(encoded) <= 75:
+        return line + "\r\n"
+    parts, current = [], b""
+    for ch in line:
+        b = ch.encode("utf-8")
+        if len(current) + len(b) > (75 if not parts else 74):
+            parts.append(current.decode("utf-8"))
+            current = b""
+        current += b
+    parts.append(current.decode("utf-8"))
+    return "\r\n ".join(parts) + "\r\n"
+
+
+def _ics_datetime(value: datetime.datetime) -> str:
+    # heure locale "flottante", comme les dates stockées en base
+    return value.strftime("%Y%m%dT%H%M%S")
+
+
+def iter_ics(rows) -> Iterator[bytes]:
+    stamp = datetime.datetime.utcnow().strftime("%Y%m%dT%H%M%SZ")
+    yield ("BEGIN:VCALENDAR\r\nVERSION:2.0\r\nPRODID:-//Agenda//Emploi du temps//FR\r\n"
+           "CALSCALE:GREGORIAN\r\n").encode("utf-8")
+    for e in rows:
+        lines = [
+            "BEGIN:VEVENT",
+            f"UID:evenement-{e.id}@agenda",
+            f"DTSTAMP:{stamp}",
+            f"DTSTART:{_ics_datetime(e.date_debut)}",
+            f"DTEND:{_ics_datetime(e.date_fin)}",
+            f"SUMMARY:{_ics_escape(e.matiere_nom)}",
+        ]
+        salle = e.salle or e.matiere_salle
+        if salle:
+            lines.append(f"LOCATION:{_ics_escape(salle)}")
+        details = " — ".join(x for x in (e.professeur, e.description) if x)
+        if details:
+            lines.append(f"DESCRIPTION:{_ics_escape(details)}")
+        lines.append("END:VEVENT")
+        yield "".join(_ics_fold(line) for line in lines).encode("utf-8")
+    yield b"END:VCALENDAR\r\n"
+
+
+def iter_export(db: Session, fmt: str = "csv", start: Optional[datetime.datetime] = None,
+                end: Optional[datetime.datetime] = None, classe_id: Optional[int] = None) -> Iterator[bytes]:
+    rows = iter_evenements(db, start, end, classe_id)
+    if fmt == "csv":
+        return iter_csv(rows)
+    if fmt == "ics":
+        return iter_ics(rows)
+    raise ValueError(f"Unknown export format {fmt!r} (expected one of {sorted(FORMATS)})")
+
+
+def export_bytes(db: Session, fmt: str = "csv", start: Optional[datetime.datetime] = None,
+                 end: Optional[datetime.datetime] = None, classe_id: Optional[int] = None) -> bytes:
+    """
+    Export complet (bytes), mis en cache par paramètres et version des données.
+    La clé inclut les versions et une tranche de TTL de read_cache : une entrée
+    périmée n'est plus jamais lue et finit évincée par le LRU.
+    """
+    key = (fmt, start, end, classe_id, read_cache.version(*CACHE_TOPICS),
+           int(time.monotonic() // read_cache.ttl))
+    data = _cache.get(key)
+    if data is None:
+        data = b"".join(iter_export(db, fmt, start, end, classe_id))
+        _cache.put(key, data)
+    return data
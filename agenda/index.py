@@ -0,0 +1,67 @@
+"""
+Index en mémoire des événements de l'AgendaManager.
+
+- une liste triée par date de début (recherche par bisect) pour les périodes
+  quelconques : O(log n + k) ;
+- un dictionnaire jour -> événements du jour (triés) : O(1) pour un jour.
+
+Les deux structures sont tenues à jour à chaque ajout / modification / suppression.
+"""
+import bisect
+import datetime
+from typing import Dict, Iterable, List
+
+from .models import Evenement
+
+
+class IndexEvenements:
+    def __init__(self, evenements: Iterable[Evenement] = ()):
+        self._cles: List[datetime.datetime] = []
+        self._tries: List[Evenement] = []
+        self._par_jour: Dict[datetime.date, List[Evenement]] = {}
+        self.reconstruire(evenements)
+
+    def __len__(self):
+        return len(self._tries)
+
+    def reconstruire(self, evenements: Iterable[Evenement]):
+        self._tries = sorted(evenements, key=lambda e: e.date_debut)
+        self._cles = [e.date_debut for e in self._tries]
+        self._par_jour = {}
+        for e in self._tries:
+            self._par_jour.setdefault(e.date_debut.date(), []).append(e)
+
+    def ajouter(self, evenement: Evenement):
+        i = bisect.bisect_right(self._cles, evenement.date_debut)
+        self._cles.insert(i, evenement.date_debut)
+        self._tries.insert(i, evenement)
+        jour = self._par_jour.setdefault(evenement.date_debut.date(), [])
+        j = bisect.bisect_right([e.date_debut for e in jour], evenement.date_debut)
+        jour.insert(j, evenement)
+
+    def retirer(self, evenement: Evenement):
+        """Retire l'événement (par identité) ; sa date_debut doit être celle de l'indexation."""
+        i = bisect.bisect_left(self._cles, evenement.date_debut)
+        while i < len(self._tries) and self._cles[i] == evenement.date_debut:
+            if self._tries[i] is evenement:
+                del self._cles[i]
+                del self._tries[i]
+                break
+            i += 1
+        jour_cle = evenement.date_debut.date()
+        jour = self._par_jour.get(jour_cle, [])
+        for k, e in enumerate(jour):
+            if e is evenement:
+                del jour[k]
+                break
+        if not jour:
+            self._par_jour.pop(jour_cle, None)
+
+    def par_jour(self, jour: datetime.date) -> List[Evenement]:
+        return list(self._par_jour.get(jour, ()))
+
+    def entre(self, debut: datetime.datetime, fin: datetime.datetime) -> List[Evenement]:
+        """Événements commençant dans [debut, fin), triés par date de début."""
+        i = bisect.bisect_left(self._cles, debut)
+        j = bisect.bisect_left(self._cles, fin)
+        return self._tries[i:j]
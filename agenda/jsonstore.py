@@ -0,0 +1,199 @@
+"""
+Lecture / écriture de l'instantané JSON de l'AgendaManager.
+
+Format v2 : les matières sont écrites une seule fois avec un identifiant, les
+événements y font référence par cet id sous forme compacte
+`[matiere_id, date_debut, date_fin, description]`, un par ligne :
+
+    {"version": 2, "journal_seq": 12, "matieres": [{"id": 0, ...}, ...], "evenements": [
+    [0, "2025-11-12T09:00:00", "2025-11-12T11:45:00", ""],
+    ...
+    ]}
+
+Le fichier reste du JSON valide ; cette disposition permet en plus de le lire
+ligne par ligne (`iter_snapshot`) sans charger tout le document en mémoire.
+Les fichiers v1 (matière recopiée dans chaque événement) restent lisibles.
+
+orjson est utilisé s'il est installé (AGENDA_JSON_CODEC=json pour le désactiver).
+"""
+import datetime
+import json
+import os
+import re
+from pathlib import Path
+from typing import Dict, Iterable, Iterator, List, Tuple, Union
+
+from .models import Matiere, Evenement
+
+try:
+    import orjson
+except ImportError:  # orjson est optionnel
+    orjson = None
+
+if os.environ.get("AGENDA_JSON_CODEC", "").lower() == "json":
+    orjson = None
+
+FORMAT_VERSION = 2
+# au-delà de cette taille, l'instantané est lu ligne par ligne
+STREAM_THRESHOLD = int(os.environ.get("AGENDA_JSON_STREAM_MB", "8")) * 1024 * 1024
+
+_HEADER_END = b'"evenements": [\n'
+
+
+def loads(data: Union[bytes, str]):
+    if orjson is not None:
+        return orjson.loads(data)
+    return json.loads(data)
+
+
+def dumps(obj) -> bytes:
+    """JSON compact en UTF-8."""
+    if orjson is not None:
+        return orjson.dumps(obj)
+    return json.dumps(obj, ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+
+
+def _matiere(data: Dict) -> Matiere:
+    return Matiere(data["nom"], data["professeur"], data["salle"], data.get("couleur", "#3498db"))
+
+
+def _evenement(par_id: Dict[int, Matiere], item: List) -> Evenement:
+    matiere_id, debut, fin, description = item
+    return Evenement(par_id[matiere_id], datetime.datetime.fromisoformat(debut),
+                     datetime.datetime.fromisoformat(fin), description)
+
+
+def _from_v1(data: Dict) -> Tuple[List[Matiere], List[Evenement]]:
+    matieres = [_matiere(m) for m in data.get("matieres", [])]
+    par_cle = {}
+    for m in matieres:
+        par_cle.setdefault((m.nom, m.professeur), m)
+    evenements = []
+    for event_data in data.get("evenements", []):
+        matiere = par_cle.get((event_data["matiere"]["nom"], event_data["matiere"]["professeur"]))
+        if matiere:
+            evenements.append(Evenement(
+                matiere,
+                datetime.datetime.fromisoformat(event_data["date_debut"]),
+                datetime.datetime.fromisoformat(event_data["date_fin"]),
+                event_data.get("description", ""),
+            ))
+    return matieres, evenements
+
+
+def _from_v2(data: Dict) -> Tuple[List[Matiere], List[Evenement]]:
+    matieres, par_id = [], {}
+    for m in data.get("matieres", []):
+        par_id[m["id"]] = matiere = _matiere(m)
+        matieres.append(matiere)
+    evenements = [_evenement(par_id, item) for item in data.get("evenements", [])
+                  if item[0] in par_id]
+    return matieres, evenements
+
+
+def iter_snapshot(path: Path) -> Iterator[Union[Dict, Evenement]]:
+    """
+    Lecture en flux d'un instantané v2 écrit par `write_snapshot` : produit
+    d'abord l'en-tête (version, journal_seq, matieres avec les objets Matiere
+    sous la clé "objets"), puis les événements un par un.
+    Lève ValueError si le fichier n'a pas cette disposition.
+    """
+    with open(path, "rb") as f:
+        first = f.readline()
+        if not first.endswith(_HEADER_END):
+            raise ValueError("not a line-oriented v2 snapshot")
+        header = loads(first[:-len(_HEADER_END)] + b'"evenements": []}')
+        if header.get("version") != FORMAT_VERSION:
+            raise ValueError(f"unsupported snapshot version {header.get('version')!r}")
+        par_id = {m["id"]: _matiere(m) for m in header["matieres"]}
+        header["objets"] = par_id
+        yield header
+        for line in f:
+            line = line.rstrip(b"\r\n")
+            if line.endswith(b","):
+                line = line[:-1]
+            if line == b"]}":
+                return
+            if not line:
+                continue
+            item = loads(line)
+            if item[0] in par_id:
+                yield _evenement(par_id, item)
+        raise ValueError("truncated snapshot")
+
+
+def iter_array(path: Path, key: str, chunk_size: int = 1 << 20) -> Iterator:
+    """
+    Éléments du tableau `"key": [...]` d'un document JSON, décodés un par un
+    depuis un tampon de taille bornée (fichiers v1 indentés compris).
+    """
+    decoder = json.JSONDecoder()
+    marker = re.compile(r'"%s"\s*:\s*\[' % re.escape(key))
+    with open(path, "r", encoding="utf-8") as f:
+        buf = ""
+        while True:
+            found = marker.search(buf)
+            if found:
+                buf = buf[found.end():]
+                break
+            chunk = f.read(chunk_size)
+            if not chunk:
+                return
+            # garde la fin du tampon : la clé peut être coupée entre deux blocs
+            buf = buf[-(len(key) + 64):] + chunk
+        pos = 0
+        while True:
+            while True:
+                while pos < len(buf) and buf[pos] in " \t\r\n,":
+                    pos += 1
+                if pos < len(buf) and buf[pos] == "]":
+                    return
+                try:
+                    item, end = decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    break  # élément incomplet : lire la suite
+                yield item
+                pos = end
+            chunk = f.read(chunk_size)
+            if not chunk:
+                raise ValueError(f"truncated array {key!r} in {path}")
+            buf = buf[pos:] + chunk
+            pos = 0
+
+
+def read_snapshot(path: Path) -> Tuple[List[Matiere], List[Evenement], int]:
+    """Renvoie (matieres, evenements, journal_seq) ; accepte les formats v1 et v2."""
+    path = Path(path)
+    if path.stat().st_size >= STREAM_THRESHOLD:
+        try:
+            items = iter_snapshot(path)
+            header = next(items)
+            evenements = list(items)
+            return list(header["objets"].values()), evenements, header.get("journal_seq", 0)
+        except ValueError:
+            pass  # v1 ou fichier réécrit à la main : lecture complète
+    data = loads(path.read_bytes())
+    if data.get("version", 1) >= 2:
+        matieres, evenements = _from_v2(data)
+    else:
+        matieres, evenements = _from_v1(data)
+    return matieres, evenements, data.get("journal_seq", 0)
+
+
+def write_snapshot(f, matieres: List[Matiere], evenements: Iterable[Evenement], journal_seq: int = 0):
+    """Écrit un instantané v2 dans le fichier binaire `f` (voir la disposition ci-dessus)."""
+    ids = {id(m): i for i, m in enumerate(matieres)}
+    header = {
+        "version": FORMAT_VERSION,
+        "journal_seq": journal_seq,
+        "matieres": [dict(m.to_dict(), id=i) for i, m in enumerate(matieres)],
+    }
+    f.write(dumps(header)[:-1] + b"," + _HEADER_END)
+    sep = b""
+    for e in evenements:
+        matiere_id = ids.get(id(e.matiere))
+        if matiere_id is None:
+            continue
+        f.write(sep + dumps([matiere_id, e.date_debut.isoformat(), e.date_fin.isoformat(), e.description]))
+        sep = b",\n"
+    f.write(b"\n]}\n")
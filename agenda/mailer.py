@@ -0,0 +1,292 @@
+"""
+Envoi des e-mails de notification en arrière-plan.
+
+Les notifications sont d'abord écrites dans la table `email_outbox`, puis un
+worker (thread du processus Streamlit, ou processus séparé via
+`python -m agenda.mailer`) les envoie par lots en réutilisant une seule
+connexion SMTP authentifiée par lot, avec limitation de débit et nouvelles
+tentatives espacées (backoff exponentiel).
+
+Variables d'environnement :
+    SMTP_HOST, SMTP_PORT, SMTP_USER, SMTP_PASS, SMTP_FROM
+    SMTP_SECURITY       'ssl' (défaut) | 'starttls' | 'none'
+    SMTP_RATE_PER_SEC   nombre max d'e-mails par seconde (défaut 5)
+    SMTP_MAX_ATTEMPTS   nombre de tentatives avant abandon (défaut 5)
+    SMTP_BACKOFF_S      délai de base entre deux tentatives (défaut 30)
+    SMTP_BATCH_SIZE     taille d'un lot (défaut 50)
+    SMTP_LEASE_S        durée après laquelle un lot resté 'sending' est considéré
+                        abandonné par son worker et remis en file (défaut 600)
+"""
+import datetime
+import os
+import smtplib
+import threading
+import time
+from email.message import EmailMessage
+from typing import Callable, List, NamedTuple, Optional
+
+from sqlalchemy import or_
+from sqlalchemy.orm import Session
+
+from .db import EmailOutbox, SessionLocal, init_db
+
+
+class SmtpConfig(NamedTuple):
+    host: Optional[str]
+    port: int
+    user: Optional[str]
+    password: Optional[str]
+    from_addr: str
+    security: str = "ssl"
+    rate_per_sec: float = 5.0
+    max_attempts: int = 5
+    backoff_s: float = 30.0
+    batch_size: int = 50
+    lease_s: float = 600.0
+
+    @classmethod
+    def from_env(cls) -> "SmtpConfig":
+        return cls(
+            host=os.environ.get("SMTP_HOST"),
+            port=int(os.environ.get("SMTP_PORT", "0") or 0),
+            user=os.environ.get("SMTP_USER"),
+            password=os.environ.get("SMTP_PASS"),
+            from_addr=os.environ.get("SMTP_FROM", "no-reply@example.com"),
+            security=os.environ.get("SMTP_SECURITY", "ssl").lower(),
+            rate_per_sec=float(os.environ.get("SMTP_RATE_PER_SEC", "5") or 5),
+            max_attempts=int(os.environ.get("SMTP_MAX_ATTEMPTS", "5") or 5),
+            backoff_s=float(os.environ.get("SMTP_BACKOFF_S", "30") or 30),
+            batch_size=int(os.environ.get("SMTP_BATCH_SIZE", "50") or 50),
+            lease_s=float(os.environ.get("SMTP_LEASE_S", "600") or 600),
+        )
+
+    @property
+    def enabled(self) -> bool:
+        if not (self.host and self.port):
+            return False
+        # sans chiffrement (serveur local de test), l'authentification est facultative
+        return self.security == "none" or bool(self.user and self.password)
+
+
+def open_connection(config: SmtpConfig) -> smtplib.SMTP:
+    """Ouvre et authentifie une connexion SMTP selon `config.security`."""
+    if config.security == "ssl":
+        smtp = smtplib.SMTP_SSL(config.host, config.port)
+    else:
+        smtp = smtplib.SMTP(config.host, config.port)
+        if config.security == "starttls":
+            smtp.starttls()
+    if config.user and config.password:
+        smtp.login(config.user, config.password)
+    return smtp
+
+
+# ---------- File d'attente ----------
+def enqueue_emails(db: Session, to_addrs: List[str], subject: str, content: str) -> int:
+    """Ajoute un e-mail par destinataire dans l'outbox (un seul executemany). Renvoie le nombre de lignes."""
+    if not to_addrs:
+        return 0
+    now = datetime.datetime.utcnow()
+    rows = [
+        {"to_addr": addr, "subject": subject, "content": content, "status": "pending",
+         "attempts": 0, "next_attempt_at": now, "created_at": now}
+        for addr in to_addrs
+    ]
+    db.execute(EmailOutbox.__table__.insert(), rows)
+    db.commit()
+    return len(rows)
+
+
+def _claim_batch(db: Session, limit: int) -> List[EmailOutbox]:
+    """Réserve jusqu'à `limit` e-mails dus (status pending -> sending), sans doublon entre workers."""
+    now = datetime.datetime.utcnow()
+    candidates = (db.query(EmailOutbox.id)
+                  .filter(EmailOutbox.status == "pending", EmailOutbox.next_attempt_at <= now)
+                  .order_by(EmailOutbox.id).limit(limit).all())
+    claimed = []
+    for (outbox_id,) in candidates:
+        updated = (db.query(EmailOutbox)
+                   .filter(EmailOutbox.id == outbox_id, EmailOutbox.status == "pending")
+                   .update({"status": "sending", "claimed_at": now}, synchronize_session=False))
+        if updated:
+            claimed.append(outbox_id)
+    db.commit()
+    if not claimed:
+        return []
+    return db.query(EmailOutbox).filter(EmailOutbox.id.in_(claimed)).order_by(EmailOutbox.id).all()
+
+
+def _mark_failure(item: EmailOutbox, config: SmtpConfig, error: Exception):
+    item.attempts = (item.attempts or 0) + 1
+    item.last_error = str(error)
+    if item.attempts >= config.max_attempts:
+        item.status = "failed"
+    else:
+        item.status = "pending"
+        delay = config.backoff_s * (2 ** (item.attempts - 1))
+        item.next_attempt_at = datetime.datetime.utcnow() + datetime.timedelta(seconds=delay)
+
+
+def deliver_pending(db: Session, config: Optional[SmtpConfig] = None,
+                    connect: Callable[[SmtpConfig], smtplib.SMTP] = open_connection) -> int:
+    """
+    Envoie un lot d'e-mails dus sur une seule connexion SMTP.
+    Renvoie le nombre d'e-mails envoyés avec succès.
+    """
+    config = config or SmtpConfig.from_env()
+    if not config.enabled:
+        return 0
+    batch = _claim_batch(db, config.batch_size)
+    if not batch:
+        return 0
+
+    sent = 0
+    interval = 1.0 / config.rate_per_sec if config.rate_per_sec > 0 else 0.0
+    try:
+        smtp = connect(config)
+    except Exception as exc:
+        for item in batch:
+            _mark_failure(item, config, exc)
+        db.commit()
+        return 0
+
+    try:
+        last_send = 0.0
+        for item in batch:
+            wait = interval - (time.monotonic() - last_send)
+            if wait > 0:
+                time.sleep(wait)
+            em = EmailMessage()
+            em["Subject"] = item.subject
+            em["From"] = config.from_addr
+            em["To"] = item.to_addr
+            em.set_content(item.content or "")
+            try:
+                smtp.send_message(em)
+                item.status = "sent"
+                item.sent_at = datetime.datetime.utcnow()
+                item.attempts = (item.attempts or 0) + 1
+                sent += 1
+            except smtplib.SMTPServerDisconnected as exc:
+                # connexion perdue : on remet ce message et la fin du lot en file
+                for rest in batch[batch.index(item):]:
+                    _mark_failure(rest, config, exc)
+                break
+            except Exception as exc:
+                _mark_failure(item, config, exc)
+            last_send = time.monotonic()
+            db.commit()
+    finally:
+        db.commit()
+        try:
+            smtp.quit()
+        except Exception:
+            pass
+    return sent
+
+
+def reset_stale(db: Session, lease_s: Optional[float] = None) -> int:
+    """
+    Remet en file les e-mails restés 'sending' depuis plus de `lease_s` secondes
+    (worker arrêté brutalement). Les lots réservés plus récemment appartiennent
+    peut-être à un autre worker encore actif (autre processus) : on n'y touche pas.
+    """
+    if lease_s is None:
+        lease_s = SmtpConfig.from_env().lease_s
+    expired = datetime.datetime.utcnow() - datetime.timedelta(seconds=lease_s)
+    count = (db.query(EmailOutbox)
+             .filter(EmailOutbox.status == "sending",
+                     or_(EmailOutbox.claimed_at.is_(None), EmailOutbox.claimed_at < expired))
+             .update({"status": "pending"}, synchronize_session=False))
+    db.commit()
+    return count
+
+
+# ---------- Worker ----------
+class OutboxWorker:
+    """Thread démon qui vide l'outbox ; `wake()` déclenche un passage immédiat."""
+
+    def __init__(self, session_factory=SessionLocal, config: Optional[SmtpConfig] = None,
+                 poll_interval: float = 30.0):
+        self.session_factory = session_factory
+        self.config = config
+        self.poll_interval = poll_interval
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        if self._thread and self._thread.is_alive():
+            return
+        self._stop.clear()
+        self._thread = threading.Thread(target=self._run, name="agenda-outbox", daemon=True)
+        self._thread.start()
+
+    def wake(self):
+        self._wake.set()
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join(timeout)
+
+    def run_once(self) -> int:
+        """Vide l'outbox des e-mails dus (plusieurs lots si nécessaire)."""
+        total = 0
+        db = self.session_factory()
+        try:
+            # bails expirés uniquement : sûr même si un autre worker tourne
+            reset_stale(db, (self.config or SmtpConfig.from_env()).lease_s)
+            while not self._stop.is_set():
+                sent = deliver_pending(db, self.config)
+                total += sent
+                if sent == 0:
+                    break
+        finally:
+            db.close()
+        return total
+
+    def _run(self):
+        while not self._stop.is_set():
+            try:
+                self.run_once()
+            except Exception as exc:
+                print("Erreur envoi e-mails:", exc)
+            self._wake.wait(self.poll_interval)
+            self._wake.clear()
+
+
+_worker: Optional[OutboxWorker] = None
+_worker_lock = threading.Lock()
+
+
+def get_worker() -> OutboxWorker:
+    """Worker unique par processus, démarré au premier appel."""
+    global _worker
+    with _worker_lock:
+        if _worker is None:
+            _worker = OutboxWorker()
+            _worker.start()
+        return _worker
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Envoie les e-mails en attente dans l'outbox.")
+    parser.add_argument("--once", action="store_true", help="vider l'outbox puis quitter")
+    parser.add_argument("--poll", type=float, default=30.0, help="intervalle de scrutation (s)")
+    args = parser.parse_args()
+
+    init_db()
+    worker = OutboxWorker(poll_interval=args.poll)
+    if args.once:
+        print(f"{worker.run_once()} e-mail(s) envoyé(s)")
+    else:
+        worker.start()
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            worker.stop()
@@ -1,88 +1,111 @@
-import json
+import os
 import datetime
-import calendar
+from contextlib import contextmanager
 from pathlib import Path
 from typing import List, Dict, Optional
 
 # import relatif pour éviter les cycles
 from .models import Matiere, Evenement
+from .periods import week_bounds, month_bounds, group_by_day
+from .index import IndexEvenements
+from . import jsonstore
+
+# Nombre d'opérations journalisées avant réécriture automatique de l'instantané.
+SEUIL_COMPACTION = 500
+
+
+def journal_path(data_file) -> Path:
+    """Journal des opérations récentes associé à l'instantané `data_file`."""
+    data_file = Path(data_file)
+    return data_file.with_name(data_file.name + ".journal.jsonl")
+
+
+class JournalCorrompu(ValueError):
+    """Ligne illisible au milieu du journal (et non une fin tronquée par un arrêt brutal)."""
 
 
 class AgendaManager:
+    """
+    Persistance : `data_file` est un instantané JSON complet (format v2, voir
+    agenda.jsonstore) ; chaque modification est ajoutée en une ligne à un journal
+    (`<data_file>.journal.jsonl`) au lieu de réécrire tout le fichier. Au
+    chargement, le journal est rejoué sur l'instantané ; il est compacté dans un
+    nouvel instantané (écrit puis renommé atomiquement) tous les
+    SEUIL_COMPACTION opérations.
+    """
+
     def __init__(self, data_file: str = "agenda_data.json"):
         self.data_file = Path(data_file)
+        self.journal_file = journal_path(self.data_file)
         self.evenements: List[Evenement] = []
         self.matieres: List[Matiere] = []
+        # index trié + par jour, tenu à jour par les méthodes ci-dessous
+        self._index = IndexEvenements()
+        # numéro de la dernière opération appliquée (instantané + journal)
+        self._seq = 0
+        self._ops_journal = 0
+        self._lot_profondeur = 0
+        self._lot_ops: List[Dict] = []
         self.charger_donnees()
 
     # Matières
     def ajouter_matiere(self, nom: str, professeur: str, salle: str, couleur: str) -> Matiere:
-        matiere = Matiere(nom, professeur, salle, couleur)
-        self.matieres.append(matiere)
-        self.sauvegarder_donnees()
-        return matiere
+        return self._executer({"op": "ajouter_matiere", "matiere": Matiere(nom, professeur, salle, couleur).to_dict()})
 
     def supprimer_matiere(self, index: int):
         if 0 <= index < len(self.matieres):
-            matiere_a_supprimer = self.matieres[index]
-            # Supprimer aussi les événements associés
-            self.evenements = [e for e in self.evenements if e.matiere.nom != matiere_a_supprimer.nom]
-            self.matieres.pop(index)
-            self.sauvegarder_donnees()
+            self._executer({"op": "supprimer_matiere", "index": index})
 
     # Événements
     def ajouter_evenement(self, matiere: Matiere, date_debut: datetime.datetime,
                           date_fin: datetime.datetime, description: str) -> Evenement:
-        evenement = Evenement(matiere, date_debut, date_fin, description)
-        self.evenements.append(evenement)
-        self.sauvegarder_donnees()
-        return evenement
+        return self._executer({
+            "op": "ajouter_evenement",
+            "matiere": self._index_matiere(matiere),
+            "date_debut": date_debut.isoformat(),
+            "date_fin": date_fin.isoformat(),
+            "description": description,
+        })
 
     def modifier_evenement(self, index: int, matiere: Optional[Matiere] = None,
                            date_debut: Optional[datetime.datetime] = None,
                            date_fin: Optional[datetime.datetime] = None,
                            description: Optional[str] = None):
         if 0 <= index < len(self.evenements):
+            op = {"op": "modifier_evenement", "index": index}
             if matiere:
-                self.evenements[index].matiere = matiere
+                op["matiere"] = self._index_matiere(matiere)
             if date_debut:
-                self.evenements[index].date_debut = date_debut
+                op["date_debut"] = date_debut.isoformat()
             if date_fin:
-                self.evenements[index].date_fin = date_fin
+                op["date_fin"] = date_fin.isoformat()
             if description is not None:
-                self.evenements[index].description = description
-            self.sauvegarder_donnees()
+                op["description"] = description
+            self._executer(op)
 
     def supprimer_evenement(self, index: int):
         if 0 <= index < len(self.evenements):
-            self.evenements.pop(index)
-            self.sauvegarder_donnees()
+            self._executer({"op": "supprimer_evenement", "index": index})
 
     # Recherches / filtres
     def get_evenements_par_jour(self, date: datetime.datetime) -> List[Evenement]:
-        return [e for e in self.evenements if e.date_debut.date() == date.date()]
+        jour = date.date() if isinstance(date, datetime.datetime) else date
+        return self._index.par_jour(jour)
+
+    def get_evenements_entre(self, debut: datetime.datetime, fin: datetime.datetime) -> List[Evenement]:
+        """Événements commençant dans l'intervalle [debut, fin), triés par date de début."""
+        return self._index.entre(debut, fin)
 
     def get_evenements_semaine(self, date_reference: datetime.datetime) -> List[Dict]:
-        debut_semaine = date_reference - datetime.timedelta(days=date_reference.weekday())
-        evenements_semaine = []
-        for i in range(7):
-            jour = debut_semaine + datetime.timedelta(days=i)
-            evenements_jour = self.get_evenements_par_jour(jour)
-            evenements_semaine.append({
-                "date": jour,
-                "evenements": sorted(evenements_jour, key=lambda x: x.date_debut)
-            })
-        return evenements_semaine
+        debut, fin = week_bounds(date_reference)
+        par_jour = group_by_day(self.get_evenements_entre(debut, fin), debut, fin)
+        return [{"date": datetime.datetime.combine(jour, datetime.time.min), "evenements": evenements}
+                for jour, evenements in par_jour.items()]
 
     def get_evenements_mois(self, annee: int, mois: int) -> Dict[int, List[Evenement]]:
-        evenements_mois: Dict[int, List[Evenement]] = {}
-        cal = calendar.monthcalendar(annee, mois)
-        for semaine in cal:
-            for jour in semaine:
-                if jour != 0:
-                    date = datetime.datetime(annee, mois, jour)
-                    evenements_mois[jour] = self.get_evenements_par_jour(date)
-        return evenements_mois
+        debut, fin = month_bounds(annee, mois)
+        par_jour = group_by_day(self.get_evenements_entre(debut, fin), debut, fin)
+        return {jour.day: evenements for jour, evenements in par_jour.items()}
 
     def rechercher_evenements(self, query: str) -> List[Evenement]:
         query_lower = query.lower()
@@ -90,54 +113,177 @@ class AgendaManager:
                 or query_lower in e.matiere.professeur.lower()
                 or query_lower in e.description.lower()]
 
+    # Opérations
+    def _index_matiere(self, matiere: Matiere) -> int:
+        """Position de la matière dans self.matieres (ajoutée si elle n'y est pas encore)."""
+        for i, m in enumerate(self.matieres):
+            if m is matiere:
+                return i
+        for i, m in enumerate(self.matieres):
+            if m.nom == matiere.nom and m.professeur == matiere.professeur:
+                return i
+        self.ajouter_matiere(matiere.nom, matiere.professeur, matiere.salle, matiere.couleur)
+        return len(self.matieres) - 1
+
+    def _appliquer(self, op: Dict):
+        """Applique une opération à l'état en mémoire (utilisé aussi pour rejouer le journal)."""
+        kind = op["op"]
+        if kind == "ajouter_matiere":
+            data = op["matiere"]
+            matiere = Matiere(data["nom"], data["professeur"], data["salle"], data.get("couleur", "#3498db"))
+            self.matieres.append(matiere)
+            return matiere
+        if kind == "supprimer_matiere":
+            matiere_a_supprimer = self.matieres[op["index"]]
+            # Supprimer aussi les événements associés
+            self.evenements = [e for e in self.evenements if e.matiere.nom != matiere_a_supprimer.nom]
+            self._index.reconstruire(self.evenements)
+            self.matieres.pop(op["index"])
+            return None
+        if kind == "ajouter_evenement":
+            evenement = Evenement(
+                self.matieres[op["matiere"]],
+                datetime.datetime.fromisoformat(op["date_debut"]),
+                datetime.datetime.fromisoformat(op["date_fin"]),
+                op.get("description", ""),
+            )
+            self.evenements.append(evenement)
+            self._index.ajouter(evenement)
+            return evenement
+        if kind == "modifier_evenement":
+            evenement = self.evenements[op["index"]]
+            if "matiere" in op:
+                evenement.matiere = self.matieres[op["matiere"]]
+            if "date_debut" in op:
+                # réindexer : la position dépend de date_debut
+                self._index.retirer(evenement)
+                evenement.date_debut = datetime.datetime.fromisoformat(op["date_debut"])
+                self._index.ajouter(evenement)
+            if "date_fin" in op:
+                evenement.date_fin = datetime.datetime.fromisoformat(op["date_fin"])
+            if "description" in op:
+                evenement.description = op["description"]
+            return evenement
+        if kind == "supprimer_evenement":
+            self._index.retirer(self.evenements.pop(op["index"]))
+            return None
+        raise ValueError(f"Unknown journal operation {kind!r}")
+
+    def _executer(self, op: Dict):
+        result = self._appliquer(op)
+        self._seq += 1
+        op["seq"] = self._seq
+        if self._lot_profondeur:
+            self._lot_ops.append(op)
+        else:
+            self._journaliser([op])
+        return result
+
+    @contextmanager
+    def lot(self):
+        """
+        Regroupe plusieurs modifications : elles sont appliquées en mémoire
+        immédiatement mais écrites sur disque en une seule fois à la sortie du bloc.
+
+            with manager.lot():
+                for ...:
+                    manager.ajouter_evenement(...)
+        """
+        self._lot_profondeur += 1
+        try:
+            yield self
+        finally:
+            self._lot_profondeur -= 1
+            if not self._lot_profondeur and self._lot_ops:
+                ops, self._lot_ops = self._lot_ops, []
+                self._journaliser(ops)
+
     # Sauvegarde / Chargement
+    def _journaliser(self, ops: List[Dict]):
+        try:
+            lines = b"".join(jsonstore.dumps(op) + b"\n" for op in ops)
+            with self.journal_file.open("ab") as f:
+                f.write(lines)
+                f.flush()
+                os.fsync(f.fileno())
+            self._ops_journal += len(ops)
+            if self._ops_journal >= SEUIL_COMPACTION:
+                self.compacter()
+        except Exception as exc:
+            print("Erreur sauvegarde:", exc)
+
+    def compacter(self):
+        """Écrit un instantané complet (fichier temporaire + renommage atomique) puis vide le journal."""
+        self.sauvegarder_donnees()
+
     def sauvegarder_donnees(self):
-        data = {
-            "matieres": [m.to_dict() for m in self.matieres],
-            "evenements": [e.to_dict() for e in self.evenements]
-        }
         try:
-            with self.data_file.open("w", encoding="utf-8") as f:
-                json.dump(data, f, indent=2, ensure_ascii=False)
+            tmp = self.data_file.with_name(self.data_file.name + ".tmp")
+            with tmp.open("wb") as f:
+                jsonstore.write_snapshot(f, self.matieres, self.evenements, self._seq)
+                f.flush()
+                os.fsync(f.fileno())
+            os.replace(tmp, self.data_file)
+            # l'instantané contient journal_seq : un journal non vidé (arrêt brutal
+            # juste ici) ne serait pas rejoué deux fois
+            if self.journal_file.exists():
+                self.journal_file.unlink()
+            self._ops_journal = 0
         except Exception as exc:
             # Si tu veux logger, tu peux utiliser logging
             print("Erreur sauvegarde:", exc)
 
     def charger_donnees(self):
         try:
+            self.matieres = []
+            self.evenements = []
+            self._seq = 0
             if self.data_file.exists():
-                with self.data_file.open("r", encoding="utf-8") as f:
-                    data = json.load(f)
-
-                self.matieres = []
-                self.evenements = []
-
-                for matiere_data in data.get("matieres", []):
-                    matiere = Matiere(
-                        matiere_data["nom"],
-                        matiere_data["professeur"],
-                        matiere_data["salle"],
-                        matiere_data.get("couleur", "#3498db")
-                    )
-                    self.matieres.append(matiere)
-
-                for event_data in data.get("evenements", []):
-                    matiere_data = event_data["matiere"]
-                    # Trouver la matière correspondante
-                    matiere_trouvee = None
-                    for m in self.matieres:
-                        if (m.nom == matiere_data["nom"] and
-                                m.professeur == matiere_data["professeur"]):
-                            matiere_trouvee = m
-                            break
-
-                    if matiere_trouvee:
-                        evenement = Evenement(
-                            matiere_trouvee,
-                            datetime.datetime.fromisoformat(event_data["date_debut"]),
-                            datetime.datetime.fromisoformat(event_data["date_fin"]),
-                            event_data.get("description", "")
-                        )
-                        self.evenements.append(evenement)
+                self.matieres, self.evenements, self._seq = jsonstore.read_snapshot(self.data_file)
+            self._index.reconstruire(self.evenements)
+            self._rejouer_journal()
+        except JournalCorrompu:
+            # ne pas continuer : les ajouts suivants iraient derrière la ligne illisible
+            raise
         except Exception as exc:
-            print("Erreur chargement:", exc)
\ No newline at end of file
+            print("Erreur chargement:", exc)
+
+    def _rejouer_journal(self):
+        """
+        Rejoue le journal sur l'instantané. Une dernière ligne tronquée (arrêt
+        brutal pendant un ajout) est retirée du fichier avant tout nouvel ajout ;
+        une ligne illisible suivie d'autres lignes lève JournalCorrompu.
+        """
+        self._ops_journal = 0
+        if not self.journal_file.exists():
+            return
+        valide = 0  # fin de la dernière ligne lisible
+        with self.journal_file.open("rb") as f:
+            for numero, line in enumerate(f, 1):
+                try:
+                    op = jsonstore.loads(line)
+                except ValueError:
+                    if f.read(1):
+                        raise JournalCorrompu(f"{self.journal_file}: ligne {numero} illisible")
+                    break
+                valide += len(line)
+                self._ops_journal += 1
+                if op.get("seq", 0) > self._seq:
+                    self._appliquer(op)
+                    self._seq = op["seq"]
+            fin = f.seek(0, os.SEEK_END)
+            if valide:
+                f.seek(valide - 1)
+                termine = f.read(1) == b"\n"
+            else:
+                termine = True
+        if valide == fin and termine:
+            return
+        with self.journal_file.open("r+b") as f:
+            f.truncate(valide)
+            if not termine:
+                # dernière opération complète mais sans fin de ligne
+                f.seek(valide)
+                f.write(b"\n")
+            f.flush()
+            os.fsync(f.fileno())
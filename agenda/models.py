@@ -1,13 +1,23 @@
 from typing import Dict
 import datetime
+import sys
+
+
+def _intern(value):
+    # les champs peuvent être None (ex. "salle": null dans le JSON)
+    return sys.intern(value) if isinstance(value, str) else value
 
 
 class Matiere:
+    # __slots__ : pas de __dict__ par instance ; les chaînes sont internées, les
+    # événements d'une même matière partagent l'objet Matiere (voir jsonstore)
+    __slots__ = ("nom", "professeur", "salle", "couleur")
+
     def __init__(self, nom: str, professeur: str, salle: str, couleur: str = "#3498db"):
-        self.nom = nom
-        self.professeur = professeur
-        self.salle = salle
-        self.couleur = couleur
+        self.nom = _intern(nom)
+        self.professeur = _intern(professeur)
+        self.salle = _intern(salle)
+        self.couleur = _intern(couleur)
 
     def to_dict(self) -> Dict:
         return {
@@ -22,6 +32,8 @@ class Matiere:
 
 
 class Evenement:
+    __slots__ = ("matiere", "date_debut", "date_fin", "description")
+
     def __init__(self, matiere: Matiere, date_debut: datetime.datetime,
                  date_fin: datetime.datetime, description: str = ""):
         self.matiere = matiere
@@ -38,4 +50,4 @@ class Evenement:
         }
 
     def __repr__(self):
-        return f"Evenement(matiere={self.matiere.nom!r}, date_debut={self.date_debut!r})"
\ No newline at end of file
+        return f"Evenement(matiere={self.matiere.nom!r}, date_debut={self.date_debut!r})"
@@ -0,0 +1,56 @@
+"""
+Helpers de calendrier partagés par les vues (app) et l'AgendaManager :
+bornes de semaine / mois et regroupement d'événements par jour.
+"""
+import calendar
+import datetime
+from typing import Dict, Iterable, List, Tuple, TypeVar
+
+T = TypeVar("T")
+
+
+def _as_date(value) -> datetime.date:
+    if isinstance(value, datetime.datetime):
+        return value.date()
+    return value
+
+
+def day_bounds(day) -> Tuple[datetime.datetime, datetime.datetime]:
+    """Intervalle [début, fin) couvrant le jour donné."""
+    start = datetime.datetime.combine(_as_date(day), datetime.time.min)
+    return start, start + datetime.timedelta(days=1)
+
+
+def week_bounds(reference) -> Tuple[datetime.datetime, datetime.datetime]:
+    """Intervalle [lundi 00:00, lundi suivant 00:00) contenant la date de référence."""
+    ref = _as_date(reference)
+    monday = ref - datetime.timedelta(days=ref.weekday())
+    start = datetime.datetime.combine(monday, datetime.time.min)
+    return start, start + datetime.timedelta(days=7)
+
+
+def month_bounds(year: int, month: int) -> Tuple[datetime.datetime, datetime.datetime]:
+    """Intervalle [1er du mois 00:00, 1er du mois suivant 00:00)."""
+    start = datetime.datetime(year, month, 1)
+    nb_days = calendar.monthrange(year, month)[1]
+    return start, start + datetime.timedelta(days=nb_days)
+
+
+def group_by_day(events: Iterable[T], start, end) -> Dict[datetime.date, List[T]]:
+    """
+    Regroupe des objets ayant un attribut `date_debut` par jour, pour chaque jour
+    de l'intervalle [start, end). Les jours sans événement ont une liste vide et
+    chaque liste est triée par `date_debut`.
+    """
+    first = _as_date(start)
+    nb_days = (_as_date(end) - first).days
+    buckets: Dict[datetime.date, List[T]] = {
+        first + datetime.timedelta(days=i): [] for i in range(nb_days)
+    }
+    for e in events:
+        bucket = buckets.get(e.date_debut.date())
+        if bucket is not None:
+            bucket.append(e)
+    for bucket in buckets.values():
+        bucket.sort(key=lambda x: x.date_debut)
+    return buckets
@@ -0,0 +1,409 @@
+"""
+Migrations versionnées du schéma SQLite.
+
+La table `schema_version` garde une ligne par migration appliquée. Chaque
+migration est appliquée une seule fois, dans sa propre transaction
+(`BEGIN IMMEDIATE` : deux processus qui démarrent ensemble ne l'appliquent
+pas deux fois), et la version est enregistrée dans la même transaction.
+
+Au démarrage, `upgrade()` ne fait qu'une requête si la base est à jour.
+
+Les bases créées avant le suivi des versions (par create_all puis les anciens
+scripts de migrations/, lancés à la main ou non) partent de la version 0 :
+chaque migration vérifie donc l'état réel (table / colonne / index) avant
+d'agir. La migration 1 crée les tables manquantes d'après les modèles
+actuels ; une modification ultérieure des modèles doit ajouter une migration
+à la fin de MIGRATIONS, jamais modifier une migration existante.
+
+Usage:
+    python -m agenda.schema            # applique les migrations en attente
+    python -m agenda.schema --status   # affiche la version et les migrations en attente
+"""
+import datetime
+import hashlib
+import mimetypes
+import os
+import shutil
+import sqlite3
+import tempfile
+from pathlib import Path, PureWindowsPath
+from typing import Callable, List, NamedTuple, Optional
+
+from sqlalchemy.schema import CreateIndex, CreateTable
+
+from . import db as _db
+from .db import Base, BASE_DIR
+
+UPLOADS_DIR = BASE_DIR / "uploads"
+BLOBS_DIR = UPLOADS_DIR / "blobs"
+
+
+class Migration(NamedTuple):
+    version: int
+    description: str
+    # apply(conn, after_commit) ; after_commit reçoit les actions sur fichiers
+    # à faire seulement une fois la transaction validée
+    apply: Callable[[sqlite3.Connection, List[Callable[[], None]]], None]
+
+
+def table_exists(conn, table):
+    cur = conn.execute("SELECT name FROM sqlite_master WHERE type='table' AND name=?;", (table,))
+    return cur.fetchone() is not None
+
+
+def column_exists(conn, table, column):
+    cols = [row[1] for row in conn.execute(f"PRAGMA table_info({table});")]
+    return column in cols
+
+
+def index_exists(conn, name):
+    cur = conn.execute("SELECT name FROM sqlite_master WHERE type='index' AND name=?;", (name,))
+    return cur.fetchone() is not None
+
+
+def add_column(conn, table, column, sql_type):
+    if not table_exists(conn, table):
+        print(f"[migration] Table '{table}' does not exist; skipping column '{column}'.")
+    elif not column_exists(conn, table, column):
+        print(f"[migration] Adding column '{column}' to {table}")
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {sql_type};")
+
+
+def _ddl(element) -> str:
+    return str(element.compile(dialect=_db.engine.dialect)).strip()
+
+
+# ---------- Migrations ----------
+
+def create_missing_tables(conn, after_commit):
+    for table in Base.metadata.sorted_tables:
+        if table_exists(conn, table.name):
+            continue
+        print(f"[migration] Creating table '{table.name}'")
+        conn.execute(_ddl(CreateTable(table)))
+        for index in table.indexes:
+            conn.execute(_ddl(CreateIndex(index, if_not_exists=True)))
+
+
+def add_devoir_file_columns(conn, after_commit):
+    # remplace add_devoir_file_columns.py et add_devoir_file_columns_and_attendance.py
+    add_column(conn, "devoirs", "file_name", "TEXT")
+    add_column(conn, "devoirs", "file_path", "TEXT")
+
+
+def add_attendance_devoir(conn, after_commit):
+    add_column(conn, "attendances", "devoir_id", "INTEGER REFERENCES devoirs(id)")
+
+
+def add_evenement_salle(conn, after_commit):
+    add_column(conn, "evenements", "salle", "TEXT")
+
+
+def add_user_classe(conn, after_commit):
+    add_column(conn, "users", "classe_id", "INTEGER REFERENCES classes(id)")
+
+
+def attendances_nullable_evenement(conn, after_commit):
+    """
+    L'ancien script créait attendances.evenement_id NOT NULL : impossible alors
+    de répondre à un devoir. SQLite ne sait pas retirer une contrainte, on
+    reconstruit la table d'après le modèle.
+    """
+    cols = {row[1]: row for row in conn.execute("PRAGMA table_info(attendances);")}
+    if "evenement_id" not in cols or not cols["evenement_id"][3]:
+        return
+    print("[migration] Rebuilding table 'attendances' (evenement_id nullable)")
+    table = Base.metadata.tables["attendances"]
+    conn.execute(_ddl(CreateTable(table)).replace("CREATE TABLE attendances", "CREATE TABLE attendances__new", 1))
+    common = ", ".join(c.name for c in table.columns if c.name in cols)
+    conn.execute(f"INSERT INTO attendances__new ({common}) SELECT {common} FROM attendances;")
+    conn.execute("DROP TABLE attendances;")
+    conn.execute("ALTER TABLE attendances__new RENAME TO attendances;")
+
+
+# (nom, table, colonnes, unique)
+INDEXES = [
+    ("ix_users_role_classe", "users", ("role", "classe_id"), False),
+    ("ix_matieres_professeur_id", "matieres", ("professeur_id",), False),
+    ("ix_evenements_date_debut", "evenements", ("date_debut",), False),
+    ("ix_evenements_matiere_date", "evenements", ("matiere_id", "date_debut"), False),
+    ("ix_devoirs_matiere_date_remise", "devoirs", ("matiere_id", "date_remise"), False),
+    ("uq_attendances_user_evenement", "attendances", ("user_id", "evenement_id"), True),
+    ("uq_attendances_user_devoir", "attendances", ("user_id", "devoir_id"), True),
+    ("ix_attendances_evenement_id", "attendances", ("evenement_id",), False),
+    ("ix_attendances_devoir_id", "attendances", ("devoir_id",), False),
+    ("ix_messages_to_user_created", "messages", ("to_user_id", "created_at"), False),
+    ("ix_messages_to_user_read", "messages", ("to_user_id", "read"), False),
+]
+
+
+def dedupe_attendances(conn, column):
+    cur = conn.execute(f"""
+        DELETE FROM attendances
+        WHERE {column} IS NOT NULL AND id NOT IN (
+            SELECT MAX(id) FROM attendances WHERE {column} IS NOT NULL GROUP BY user_id, {column}
+        );
+    """)
+    if cur.rowcount:
+        print(f"[migration] Removed {cur.rowcount} duplicate attendance row(s) on {column}")
+
+
+def add_indexes(conn, after_commit):
+    for name, table, columns, unique in INDEXES:
+        if index_exists(conn, name):
+            continue
+        if not table_exists(conn, table) or not all(column_exists(conn, table, c) for c in columns):
+            print(f"[migration] Table/columns for '{name}' missing; skipping.")
+            continue
+        if unique and table == "attendances":
+            dedupe_attendances(conn, columns[1])
+        print(f"[migration] Creating index '{name}' on {table}({', '.join(columns)})")
+        conn.execute(f"CREATE {'UNIQUE ' if unique else ''}INDEX {name} ON {table} ({', '.join(columns)});")
+
+
+def locate(file_path):
+    # les chemins enregistrés peuvent venir d'une autre machine (ex. G:\...\uploads\x.pdf)
+    p = Path(file_path)
+    if p.exists():
+        return p
+    candidate = UPLOADS_DIR / PureWindowsPath(file_path).name
+    return candidate if candidate.exists() else None
+
+
+def sha256_of(path):
+    digest = hashlib.sha256()
+    with open(path, "rb") as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b""):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+def add_blob_store(conn, after_commit):
+    """
+    Colonne devoirs.blob_sha256 (la table blobs vient de la migration 1) et
+    copie des anciens fichiers '<uuid>_<nom>' de uploads/ vers
+    uploads/blobs/<sha[:2]>/<sha>. Les originaux ne sont supprimés qu'après
+    le commit : un échec laisse les fichiers d'origine en place.
+    """
+    add_column(conn, "devoirs", "blob_sha256", "VARCHAR(64) REFERENCES blobs(sha256)")
+    if not table_exists(conn, "devoirs"):
+        return
+    rows = conn.execute(
+        "SELECT id, file_path FROM devoirs WHERE file_path IS NOT NULL AND blob_sha256 IS NULL;"
+    ).fetchall()
+    stored = missing = 0
+    for devoir_id, file_path in rows:
+        source = locate(file_path)
+        if source is None:
+            print(f"[migration] File for devoir {devoir_id} not found ({file_path}); skipping.")
+            missing += 1
+            continue
+        sha = sha256_of(source)
+        target = BLOBS_DIR / sha[:2] / sha
+        if not target.exists():
+            target.parent.mkdir(parents=True, exist_ok=True)
+            fd, tmp = tempfile.mkstemp(dir=target.parent, prefix=".migration-")
+            os.close(fd)
+            shutil.copyfile(source, tmp)
+            os.replace(tmp, target)
+            stored += 1
+        if source.resolve() != target.resolve():
+            after_commit.append(lambda p=source: p.unlink(missing_ok=True))
+        conn.execute(
+            "INSERT OR IGNORE INTO blobs (sha256, path, size, refcount, created_at) VALUES (?, ?, ?, 0, ?);",
+            (sha, str(target), target.stat().st_size, datetime.datetime.utcnow().isoformat(" ")),
+        )
+        conn.execute("UPDATE blobs SET refcount = refcount + 1 WHERE sha256 = ?;", (sha,))
+        conn.execute("UPDATE devoirs SET file_path = ?, blob_sha256 = ? WHERE id = ?;", (str(target), sha, devoir_id))
+    if rows:
+        print(f"[migration] Blob store: {stored} file(s) stored, {len(rows) - stored - missing} duplicate(s), "
+              f"{missing} missing")
+
+
+def add_devoir_file_metadata(conn, after_commit):
+    add_column(conn, "devoirs", "file_size", "INTEGER")
+    add_column(conn, "devoirs", "mime_type", "TEXT")
+    if not table_exists(conn, "devoirs"):
+        return
+    rows = conn.execute(
+        "SELECT id, file_name, file_path FROM devoirs WHERE file_path IS NOT NULL AND file_size IS NULL;"
+    ).fetchall()
+    for devoir_id, file_name, file_path in rows:
+        source = locate(file_path)
+        if source is None:
+            continue
+        mime = mimetypes.guess_type(file_name or source.name)[0] or "application/octet-stream"
+        conn.execute("UPDATE devoirs SET file_size = ?, mime_type = ? WHERE id = ?;",
+                     (source.stat().st_size, mime, devoir_id))
+
+
+def add_search_index(conn, after_commit):
+    try:
+        existed = table_exists(conn, _db.FTS_TABLE)
+        for ddl in _db._FTS_DDL:
+            conn.execute(ddl)
+        if not existed:
+            conn.execute(f"INSERT INTO {_db.FTS_TABLE}(rowid, matiere, professeur, description, salle) "
+                         f"{_db._FTS_SELECT}")
+    except sqlite3.OperationalError as exc:
+        # SQLite sans FTS5 : la recherche se rabat sur LIKE
+        print("[migration] Index FTS5 indisponible:", exc)
+
+
+def trigram_search_index(conn, after_commit):
+    """
+    Recrée l'index plein texte avec le tokenizer trigram (recherche par
+    sous-chaîne) à la place de unicode61, qui ne trouvait que les préfixes de mots.
+    """
+    row = conn.execute("SELECT sql FROM sqlite_master WHERE type='table' AND name=?;", (_db.FTS_TABLE,)).fetchone()
+    if row is None or "trigram" in row[0]:
+        return
+    print(f"[migration] Rebuilding '{_db.FTS_TABLE}' with the trigram tokenizer")
+    triggers = conn.execute("SELECT name FROM sqlite_master WHERE type='trigger' AND sql LIKE ?;",
+                            (f"%{_db.FTS_TABLE}%",)).fetchall()
+    for (name,) in triggers:
+        conn.execute(f"DROP TRIGGER {name};")
+    conn.execute(f"DROP TABLE {_db.FTS_TABLE};")
+    add_search_index(conn, after_commit)
+
+
+def add_outbox_claimed_at(conn, after_commit):
+    add_column(conn, "email_outbox", "claimed_at", "DATETIME")
+
+
+def relative_blob_paths(conn, after_commit):
+    """
+    Le chemin d'un fichier joint se déduit de devoirs.blob_sha256 : on efface
+    les chemins absolus enregistrés par la migration 8 (propres à la machine)
+    et blobs.path devient relatif au dossier uploads/.
+    """
+    if table_exists(conn, "devoirs") and column_exists(conn, "devoirs", "blob_sha256"):
+        conn.execute("UPDATE devoirs SET file_path = NULL WHERE blob_sha256 IS NOT NULL;")
+    if table_exists(conn, "blobs"):
+        conn.execute("UPDATE blobs SET path = 'blobs/' || substr(sha256, 1, 2) || '/' || sha256;")
+
+
+MIGRATIONS: List[Migration] = [
+    Migration(1, "tables manquantes", create_missing_tables),
+    Migration(2, "devoirs.file_name / file_path", add_devoir_file_columns),
+    Migration(3, "attendances.devoir_id", add_attendance_devoir),
+    Migration(4, "evenements.salle", add_evenement_salle),
+    Migration(5, "users.classe_id", add_user_classe),
+    Migration(6, "attendances.evenement_id nullable", attendances_nullable_evenement),
+    Migration(7, "index secondaires", add_indexes),
+    Migration(8, "stockage des fichiers par contenu", add_blob_store),
+    Migration(9, "devoirs.file_size / mime_type", add_devoir_file_metadata),
+    Migration(10, "index plein texte des événements", add_search_index),
+    Migration(11, "email_outbox.claimed_at", add_outbox_claimed_at),
+    Migration(12, "chemins des fichiers joints déduits du sha256", relative_blob_paths),
+    Migration(13, "index plein texte trigram", trigram_search_index),
+]
+LATEST = MIGRATIONS[-1].version
+
+
+# ---------- Exécution ----------
+
+def _connect(path) -> sqlite3.Connection:
+    # isolation_level=None : les transactions sont ouvertes explicitement,
+    # y compris autour du DDL (transactionnel sous SQLite)
+    conn = sqlite3.connect(path, isolation_level=None, timeout=30)
+    conn.execute("CREATE TABLE IF NOT EXISTS schema_version ("
+                 "version INTEGER PRIMARY KEY, description TEXT NOT NULL, applied_at TEXT NOT NULL);")
+    return conn
+
+
+def current_version(conn) -> int:
+    return conn.execute("SELECT COALESCE(MAX(version), 0) FROM schema_version;").fetchone()[0]
+
+
+def pending(conn) -> List[Migration]:
+    version = current_version(conn)
+    return [m for m in MIGRATIONS if m.version > version]
+
+
+def _check(conn) -> bool:
+    """Une requête : la base est-elle à jour ? (et met à jour db.fts_available)"""
+    version, fts = conn.execute(
+        "SELECT (SELECT COALESCE(MAX(version), 0) FROM schema_version), "
+        "EXISTS(SELECT 1 FROM sqlite_master WHERE type='table' AND name=?);", (_db.FTS_TABLE,)
+    ).fetchone()
+    _db.fts_available = bool(fts)
+    return version >= LATEST
+
+
+def _apply(conn, migration: Migration) -> bool:
+    after_commit: List[Callable[[], None]] = []
+    conn.execute("BEGIN IMMEDIATE;")
+    try:
+        # un autre processus a pu l'appliquer pendant qu'on attendait le verrou
+        if current_version(conn) >= migration.version:
+            conn.execute("COMMIT;")
+            return False
+        migration.apply(conn, after_commit)
+        conn.execute("INSERT INTO schema_version (version, description, applied_at) VALUES (?, ?, ?);",
+                     (migration.version, migration.description, datetime.datetime.utcnow().isoformat(" ")))
+        conn.execute("COMMIT;")
+    except BaseException:
+        conn.execute("ROLLBACK;")
+        raise
+    for action in after_commit:
+        action()
+    return True
+
+
+def database_path(engine=None) -> Optional[str]:
+    """Chemin du fichier SQLite de l'engine, None s'il ne s'agit pas d'un fichier SQLite."""
+    url = (engine or _db.engine).url
+    if url.get_backend_name() != "sqlite" or url.database in (None, "", ":memory:"):
+        return None
+    return url.database
+
+
+def upgrade(engine=None, target: Optional[int] = None) -> List[int]:
+    """Applique les migrations en attente (jusqu'à `target`) ; renvoie les versions appliquées."""
+    path = database_path(engine)
+    if path is None:
+        # base non fichier (tests en mémoire, autre SGBD) : pas de suivi de version
+        Base.metadata.create_all(bind=engine or _db.engine)
+        _db.init_search_index()
+        return []
+    conn = _connect(path)
+    try:
+        if target is None and _check(conn):
+            return []
+        applied = []
+        for migration in MIGRATIONS:
+            if target is not None and migration.version > target:
+                break
+            if _apply(conn, migration):
+                print(f"[migration] {migration.version}: {migration.description}")
+                applied.append(migration.version)
+        _check(conn)
+        return applied
+    finally:
+        conn.close()
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Migrations du schéma agenda.db.")
+    parser.add_argument("--status", action="store_true", help="affiche la version sans rien appliquer")
+    parser.add_argument("--target", type=int, help="s'arrêter à cette version")
+    args = parser.parse_args()
+
+    db_path = database_path()
+    if args.status:
+        if db_path is None:
+            print("[migration] Not a SQLite file database; versions are not tracked.")
+        else:
+            conn = _connect(db_path)
+            try:
+                print(f"[migration] {db_path}: version {current_version(conn)} / {LATEST}")
+                for m in pending(conn):
+                    print(f"[migration] pending {m.version}: {m.description}")
+            finally:
+                conn.close()
+    else:
+        done = upgrade(target=args.target)
+        print(f"[migration] Done: {len(done)} migration(s) applied")
@@ -0,0 +1,97 @@
+"""
+Sons de notification.
+
+Les tons sont synthétisés une seule fois par jeu de paramètres
+(duration, freq, volume, rate) puis gardés en mémoire : un rerun Streamlit
+ne paie plus la synthèse. NumPy, s'il est installé, vectorise le calcul ; il
+n'est importé qu'à la première synthèse, pas au démarrage de l'application.
+Sans NumPy on se rabat sur une boucle Python, calculée elle aussi une seule fois.
+"""
+import functools
+import io
+import math
+import sys
+import wave
+from array import array
+from pathlib import Path
+from typing import Dict, List, Tuple
+
+SOUNDS_DIR = Path(__file__).resolve().parent / "sounds"
+DEFAULT_RATE = 22050
+
+# nom affiché -> suite de (durée s, fréquence Hz) ; fréquence 0 = silence
+PRESETS: Dict[str, List[Tuple[float, float]]] = {
+    "Bip": [(0.15, 880.0)],
+    "Bip grave": [(0.2, 440.0)],
+    "Double bip": [(0.1, 880.0), (0.07, 0.0), (0.1, 880.0)],
+    "Carillon": [(0.12, 659.25), (0.12, 783.99), (0.2, 1046.5)],
+}
+DEFAULT_SOUND = "Bip"
+
+_np = None  # module numpy, False s'il n'est pas installé
+
+
+def _numpy():
+    global _np
+    if _np is None:
+        try:
+            import numpy
+            _np = numpy
+        except ImportError:  # numpy est optionnel
+            _np = False
+    return _np or None
+
+
+def _samples(duration_s: float, freq: float, volume: float, sample_rate: int) -> bytes:
+    """Échantillons PCM 16 bits little-endian d'une sinusoïde."""
+    n = int(duration_s * sample_rate)
+    np = _numpy()
+    if np is not None:
+        t = np.arange(n, dtype=np.float64) / sample_rate
+        wave_data = volume * np.sin(2 * math.pi * freq * t)
+        return (wave_data * 32767.0).astype("<i2").tobytes()
+    step = 2 * math.pi * freq / sample_rate
+    pcm = array("h", (int(volume * math.sin(step * i) * 32767.0) for i in range(n)))
+    if sys.byteorder == "big":
+        pcm.byteswap()
+    return pcm.tobytes()
+
+
+def _to_wav(frames: bytes, sample_rate: int) -> bytes:
+    buf = io.BytesIO()
+    with wave.open(buf, "wb") as wf:
+        wf.setnchannels(1)
+        wf.setsampwidth(2)  # 16-bit
+        wf.setframerate(sample_rate)
+        wf.writeframes(frames)
+    return buf.getvalue()
+
+
+@functools.lru_cache(maxsize=64)
+def tone_wav(duration_s: float = 0.15, freq: float = 880.0, volume: float = 0.5,
+             sample_rate: int = DEFAULT_RATE) -> bytes:
+    """WAV (bytes) d'une sinusoïde, mémorisé par paramètres."""
+    return _to_wav(_samples(duration_s, freq, volume, sample_rate), sample_rate)
+
+
+@functools.lru_cache(maxsize=16)
+def sound_wav(name: str = DEFAULT_SOUND, volume: float = 0.5, sample_rate: int = DEFAULT_RATE) -> bytes:
+    """
+    WAV d'un son de notification : un fichier `agenda/sounds/<name>.wav` s'il
+    existe, sinon le preset synthétisé du même nom.
+    """
+    bundled = SOUNDS_DIR / f"{name}.wav"
+    if bundled.is_file():
+        return bundled.read_bytes()
+    parts = PRESETS.get(name, PRESETS[DEFAULT_SOUND])
+    frames = b"".join(
+        _samples(duration, freq, volume if freq else 0.0, sample_rate) for duration, freq in parts
+    )
+    return _to_wav(frames, sample_rate)
+
+
+def available_sounds() -> List[str]:
+    names = list(PRESETS)
+    if SOUNDS_DIR.is_dir():
+        names += sorted(p.stem for p in SOUNDS_DIR.glob("*.wav") if p.stem not in PRESETS)
+    return names
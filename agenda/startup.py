@@ -0,0 +1,105 @@
+"""
+Démarrage de l'application : préparation faite une seule fois par processus
+et mesure des temps de démarrage.
+
+Streamlit réexécute app.py à chaque interaction (rerun) mais garde les modules
+importés : l'état "déjà prêt" vit donc ici. `ensure_ready()` met le schéma à
+jour (agenda.schema), crée le dossier des uploads et l'admin par défaut et
+supprime les fichiers joints orphelins au premier appel, puis ne fait plus rien.
+
+`timings` mesure chaque exécution de app.py par étapes (imports, schéma,
+bootstrap admin, rendu). La première exécution (démarrage à froid) est
+écrite dans le journal du serveur ; avec AGENDA_TIMINGS=1, chaque rerun l'est aussi.
+"""
+import os
+import threading
+import time
+from typing import List, Optional, Tuple
+
+from sqlalchemy.orm import Session
+
+from .db import SessionLocal, User, init_db
+
+DEFAULT_ADMIN = ("admin", "admin123")
+VERBOSE = os.environ.get("AGENDA_TIMINGS", "") not in ("", "0")
+
+
+class Timings:
+    """Durées par étape de l'exécution en cours (une par thread = une par session)."""
+
+    def __init__(self):
+        self._local = threading.local()
+        self.cold: Optional[List[Tuple[str, float]]] = None  # première exécution du processus
+        self.last: Optional[List[Tuple[str, float]]] = None  # dernière exécution terminée
+
+    def start_run(self, started_at: Optional[float] = None):
+        self._local.steps = []
+        self._local.last_mark = self._local.started = started_at or time.perf_counter()
+
+    def mark(self, name: str):
+        """Enregistre le temps écoulé depuis la marque précédente sous `name`."""
+        steps = getattr(self._local, "steps", None)
+        if steps is None:
+            return
+        now = time.perf_counter()
+        steps.append((name, now - self._local.last_mark))
+        self._local.last_mark = now
+
+    def finish_run(self) -> Optional[List[Tuple[str, float]]]:
+        steps = getattr(self._local, "steps", None)
+        if steps is None:
+            return None
+        self._local.steps = None
+        first = self.cold is None
+        if first:
+            self.cold = steps
+        self.last = steps
+        if first or VERBOSE:
+            print(f"[startup] {'cold start' if first else 'rerun'}: {format_steps(steps)}")
+        return steps
+
+
+def format_steps(steps: List[Tuple[str, float]]) -> str:
+    total = sum(seconds for _, seconds in steps)
+    parts = ", ".join(f"{name} {seconds * 1000:.0f} ms" for name, seconds in steps)
+    return f"{parts} | total {total * 1000:.0f} ms"
+
+
+timings = Timings()
+
+_ready = False
+_ready_lock = threading.Lock()
+
+
+def bootstrap_admin(db: Session) -> bool:
+    """Crée l'admin par défaut s'il n'existe aucun admin. Renvoie True s'il a été créé."""
+    if db.query(User.id).filter(User.role == "admin").first() is not None:
+        return False
+    from . import crud
+    username, password = DEFAULT_ADMIN
+    crud.create_user(db, username, password, "admin", full_name="Admin par défaut")
+    return True
+
+
+def ensure_ready():
+    """Schéma, dossier des uploads, admin par défaut et ménage des blobs : une seule fois par processus."""
+    global _ready
+    if _ready:
+        return
+    with _ready_lock:
+        if _ready:
+            return
+        init_db()
+        timings.mark("schema")
+        from . import storage
+        storage.UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
+        db = SessionLocal()
+        try:
+            bootstrap_admin(db)
+            timings.mark("admin bootstrap")
+            # uploads abandonnés (devoir jamais créé) des exécutions précédentes
+            storage.gc_orphans(db)
+        finally:
+            db.close()
+        timings.mark("blob gc")
+        _ready = True
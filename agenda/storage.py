@@ -0,0 +1,209 @@
+"""
+Stockage des fichiers joints adressé par contenu.
+
+Chaque fichier est écrit une seule fois sous uploads/blobs/<2 premiers>/<sha256>,
+quel que soit le nombre de devoirs qui le référencent. La table `blobs` tient
+un compteur de références ; `gc_orphans` supprime les blobs qui n'en ont plus,
+ainsi que les fichiers jamais rattachés à un devoir (upload abandonné), une
+fois passé un délai de grâce depuis leur dernière écriture ou réutilisation
+(AGENDA_BLOB_GRACE_S, 1 h par défaut).
+
+Le chemin d'un blob se déduit toujours de son sha256 (`blob_path`) : aucun
+chemin absolu, propre à une machine, n'est enregistré en base.
+"""
+import hashlib
+import mimetypes
+import os
+import queue
+import tempfile
+import threading
+import time
+from pathlib import Path, PureWindowsPath
+from typing import BinaryIO, NamedTuple, Optional
+
+from sqlalchemy.dialects.sqlite import insert as sqlite_insert
+from sqlalchemy.orm import Session
+
+from .db import BASE_DIR, Blob
+
+UPLOADS_DIR = BASE_DIR / "uploads"
+BLOBS_DIR = UPLOADS_DIR / "blobs"
+CHUNK_SIZE = int(os.environ.get("AGENDA_UPLOAD_CHUNK_KB", "1024")) * 1024
+# taille maximale d'un fichier joint (0 = illimitée)
+MAX_UPLOAD_BYTES = int(float(os.environ.get("AGENDA_UPLOAD_MAX_MB", "100")) * 1024 * 1024)
+# âge minimal d'un fichier non référencé avant que gc_orphans le supprime
+GRACE_SECONDS = float(os.environ.get("AGENDA_BLOB_GRACE_S", "3600"))
+
+
+class UploadTooLarge(ValueError):
+    pass
+
+
+class StoredFile(NamedTuple):
+    sha256: str
+    size: int
+    path: Path
+    mime_type: Optional[str] = None
+
+
+def blob_path(sha256: str) -> Path:
+    return BLOBS_DIR / sha256[:2] / sha256
+
+
+def devoir_file(file_path: Optional[str], blob_sha256: Optional[str]) -> Optional[str]:
+    """
+    Chemin local du fichier joint d'un devoir : déduit du sha256 pour le
+    stockage dédupliqué ; pour les anciens devoirs, `file_path` tel quel s'il
+    existe, sinon le même nom dans uploads/ (chemins venus d'une autre machine).
+    """
+    if blob_sha256:
+        return str(blob_path(blob_sha256))
+    if not file_path:
+        return None
+    if os.path.exists(file_path):
+        return file_path
+    return str(UPLOADS_DIR / PureWindowsPath(file_path).name)
+
+
+def guess_mime_type(name: Optional[str], declared: Optional[str] = None) -> str:
+    if declared:
+        return declared
+    guessed, _ = mimetypes.guess_type(name or "")
+    return guessed or "application/octet-stream"
+
+
+class _BackgroundHasher:
+    """SHA-256 calculé dans un thread pendant que le thread appelant écrit sur disque
+    (hashlib relâche le GIL sur les gros blocs, les deux se recouvrent)."""
+
+    def __init__(self):
+        self._digest = hashlib.sha256()
+        self._queue: "queue.Queue[Optional[bytes]]" = queue.Queue(maxsize=8)
+        self._thread = threading.Thread(target=self._run, daemon=True)
+        self._thread.start()
+
+    def _run(self):
+        while True:
+            chunk = self._queue.get()
+            if chunk is None:
+                return
+            self._digest.update(chunk)
+
+    def update(self, chunk: bytes):
+        self._queue.put(chunk)
+
+    def hexdigest(self) -> str:
+        self._queue.put(None)
+        self._thread.join()
+        return self._digest.hexdigest()
+
+
+def save_stream(stream: BinaryIO, name: Optional[str] = None, mime_type: Optional[str] = None,
+                chunk_size: int = CHUNK_SIZE, max_bytes: int = MAX_UPLOAD_BYTES) -> StoredFile:
+    """
+    Copie le flux par blocs de `chunk_size` dans un fichier temporaire en
+    calculant son SHA-256 au fil de l'eau, puis le renomme atomiquement à sa
+    place définitive. Si un blob identique existe déjà, le fichier temporaire
+    est simplement supprimé. Lève `UploadTooLarge` au-delà de `max_bytes`.
+    """
+    BLOBS_DIR.mkdir(parents=True, exist_ok=True)
+    hasher = _BackgroundHasher()
+    size = 0
+    fd, tmp_name = tempfile.mkstemp(dir=BLOBS_DIR, prefix=".upload-")
+    try:
+        with os.fdopen(fd, "wb") as tmp:
+            while True:
+                chunk = stream.read(chunk_size)
+                if not chunk:
+                    break
+                size += len(chunk)
+                if max_bytes and size > max_bytes:
+                    raise UploadTooLarge(f"Fichier trop volumineux (max {max_bytes // (1024 * 1024)} Mo)")
+                hasher.update(chunk)
+                tmp.write(chunk)
+            tmp.flush()
+            os.fsync(tmp.fileno())
+        sha = hasher.hexdigest()
+        target = blob_path(sha)
+        if target.exists():
+            os.unlink(tmp_name)
+            # rajeunit le fichier : gc_orphans ne le prend pas pour un upload abandonné
+            os.utime(target)
+        else:
+            target.parent.mkdir(parents=True, exist_ok=True)
+            os.replace(tmp_name, target)
+        return StoredFile(sha, size, target, guess_mime_type(name, mime_type))
+    except BaseException:
+        hasher.hexdigest()  # arrête le thread
+        if os.path.exists(tmp_name):
+            os.unlink(tmp_name)
+        raise
+
+
+def acquire(db: Session, stored: StoredFile):
+    """Enregistre le blob si besoin et incrémente son compteur (sans commit)."""
+    db.execute(sqlite_insert(Blob).values(
+        sha256=stored.sha256, path=blob_path(stored.sha256).relative_to(UPLOADS_DIR).as_posix(),
+        size=stored.size, refcount=0,
+    ).on_conflict_do_nothing(index_elements=[Blob.sha256]))
+    db.query(Blob).filter(Blob.sha256 == stored.sha256).update(
+        {"refcount": Blob.refcount + 1}, synchronize_session=False)
+
+
+def release(db: Session, sha256: str):
+    """Décrémente le compteur de références (sans commit)."""
+    db.query(Blob).filter(Blob.sha256 == sha256, Blob.refcount > 0).update(
+        {"refcount": Blob.refcount - 1}, synchronize_session=False)
+
+
+def _unlink(path: Path):
+    try:
+        os.unlink(path)
+    except FileNotFoundError:
+        pass
+
+
+def _recent(path: Path, cutoff: float) -> bool:
+    try:
+        return path.stat().st_mtime > cutoff
+    except FileNotFoundError:
+        return False
+
+
+def gc_orphans(db: Session, grace_seconds: float = GRACE_SECONDS) -> int:
+    """
+    Supprime les blobs qui ne sont plus référencés, puis les fichiers du
+    stockage sans ligne `blobs`, plus vieux que `grace_seconds`. Renvoie leur nombre.
+
+    Un blob à refcount 0 modifié depuis moins de `grace_seconds` est conservé :
+    save_stream vient peut-être de le réutiliser (il le touche) pour un devoir
+    pas encore enregistré. La ligne est supprimée sous condition `refcount <= 0`
+    et le fichier n'est effacé que si la ligne l'a été et qu'il n'a pas été
+    touché entre-temps ; un fichier conservé sans ligne est repris par le
+    balayage suivant, ou réacquis par add_devoir.
+    """
+    removed = 0
+    cutoff = time.time() - grace_seconds
+    for (sha,) in db.query(Blob.sha256).filter(Blob.refcount <= 0).all():
+        path = blob_path(sha)
+        if _recent(path, cutoff):
+            continue
+        deleted = (db.query(Blob).filter(Blob.sha256 == sha, Blob.refcount <= 0)
+                   .delete(synchronize_session=False))
+        db.commit()
+        if deleted and not _recent(path, cutoff):
+            _unlink(path)
+            removed += 1
+
+    if not BLOBS_DIR.is_dir():
+        return removed
+    known = {sha for (sha,) in db.query(Blob.sha256)}
+    for path in BLOBS_DIR.glob("*/*"):
+        if path.name not in known and path.exists() and not _recent(path, cutoff):
+            _unlink(path)
+            removed += 1
+    # fichiers temporaires laissés par un upload interrompu
+    for path in BLOBS_DIR.glob(".upload-*"):
+        if not _recent(path, cutoff):
+            _unlink(path)
+    return removed
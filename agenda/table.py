@@ -0,0 +1,105 @@
+"""
+Stockage en colonnes des événements, pour les gros agendas gardés en mémoire.
+
+Au lieu d'un objet Evenement (et de deux datetime) par événement, EventTable
+garde :
+- début et fin en microsecondes depuis 1970-01-01 (heure locale "flottante",
+  comme les datetime naïfs de l'agenda) dans deux tableaux int64 ;
+- l'indice de la matière (dans `matieres`) dans un tableau int32 ;
+- la description dans une liste (chaîne vide partagée).
+
+Les objets Evenement ne sont créés qu'à la lecture (`table[i]`, itération,
+`entre`). Les tableaux viennent du module `array` ; si NumPy est installé,
+`entre` filtre les colonnes de façon vectorisée.
+"""
+import datetime
+from array import array
+from typing import Iterable, Iterator, List, Optional
+
+from .models import Matiere, Evenement
+
+try:
+    import numpy as np
+except ImportError:  # numpy est optionnel
+    np = None
+
+_EPOCH = datetime.datetime(1970, 1, 1)
+
+
+def to_epoch_us(value: datetime.datetime) -> int:
+    delta = value - _EPOCH
+    return (delta.days * 86400 + delta.seconds) * 1_000_000 + delta.microseconds
+
+
+def from_epoch_us(value: int) -> datetime.datetime:
+    return _EPOCH + datetime.timedelta(microseconds=value)
+
+
+class EventTable:
+    def __init__(self, matieres: Iterable[Matiere] = ()):
+        self.matieres: List[Matiere] = []
+        self._matiere_ids = {}
+        for m in matieres:
+            self.matiere_id(m)
+        self.debut = array("q")
+        self.fin = array("q")
+        self.matiere = array("i")
+        self.description: List[str] = []
+
+    @classmethod
+    def from_evenements(cls, evenements: Iterable[Evenement], matieres: Iterable[Matiere] = ()) -> "EventTable":
+        table = cls(matieres)
+        table.extend(evenements)
+        return table
+
+    def __len__(self):
+        return len(self.debut)
+
+    def matiere_id(self, matiere: Matiere) -> int:
+        """Indice de la matière (par identité), ajoutée à la table si besoin."""
+        key = id(matiere)
+        if key not in self._matiere_ids:
+            self._matiere_ids[key] = len(self.matieres)
+            self.matieres.append(matiere)
+        return self._matiere_ids[key]
+
+    def append(self, matiere: Matiere, date_debut: datetime.datetime, date_fin: datetime.datetime,
+               description: str = ""):
+        self.debut.append(to_epoch_us(date_debut))
+        self.fin.append(to_epoch_us(date_fin))
+        self.matiere.append(self.matiere_id(matiere))
+        self.description.append(description or "")
+
+    def extend(self, evenements: Iterable[Evenement]):
+        for e in evenements:
+            self.append(e.matiere, e.date_debut, e.date_fin, e.description)
+
+    def __getitem__(self, i: int) -> Evenement:
+        return Evenement(self.matieres[self.matiere[i]], from_epoch_us(self.debut[i]),
+                         from_epoch_us(self.fin[i]), self.description[i])
+
+    def __iter__(self) -> Iterator[Evenement]:
+        for i in range(len(self)):
+            yield self[i]
+
+    def indices_entre(self, debut: datetime.datetime, fin: datetime.datetime,
+                      matiere: Optional[Matiere] = None) -> List[int]:
+        """Indices des événements commençant dans [debut, fin) (et de la matière)."""
+        lo, hi = to_epoch_us(debut), to_epoch_us(fin)
+        mid = self._matiere_ids.get(id(matiere)) if matiere is not None else None
+        if matiere is not None and mid is None:
+            return []
+        if np is not None:
+            starts = np.frombuffer(self.debut, dtype=np.int64)
+            mask = (starts >= lo) & (starts < hi)
+            if mid is not None:
+                mask &= np.frombuffer(self.matiere, dtype=np.int32) == mid
+            return np.flatnonzero(mask).tolist()
+        return [i for i, start in enumerate(self.debut)
+                if lo <= start < hi and (mid is None or self.matiere[i] == mid)]
+
+    def entre(self, debut: datetime.datetime, fin: datetime.datetime,
+              matiere: Optional[Matiere] = None) -> List[Evenement]:
+        """Événements commençant dans [debut, fin), triés par date de début."""
+        indices = sorted(self.indices_entre(debut, fin, matiere), key=self.debut.__getitem__)
+        return [self[i] for i in indices]
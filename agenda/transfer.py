@@ -0,0 +1,229 @@
+"""
+Transfert en masse entre le fichier JSON de l'AgendaManager (agenda_data.json,
+formats v1 et v2) et la base SQLAlchemy (tables matieres / evenements).
+
+Import : le fichier est lu en flux (mémoire bornée), les professeurs sont
+rattachés aux comptes `prof` existants (nom complet ou identifiant, sans tenir
+compte de la casse), les matières sont dédoublonnées sur (nom, professeur) —
+y compris avec celles déjà en base — et les événements sont insérés par lots,
+un commit par lot. Un événement déjà présent (même matière, début, fin et
+description) n'est pas réinséré : relancer l'import ne crée pas de doublons.
+
+Les opérations récentes de l'AgendaManager sont dans un journal à côté de
+l'instantané (`<fichier>.journal.jsonl`, voir agenda.manager) : s'il existe,
+l'import charge le tout via l'AgendaManager (en mémoire) au lieu du flux, et
+l'export le supprime une fois le nouvel instantané en place.
+
+Export : la base est relue par lots (`yield_per`) et écrite au format v2.
+
+Usage:
+    python -m agenda.transfer import agenda_data.json [--batch 5000] [--create-profs]
+    python -m agenda.transfer export agenda_data.json
+"""
+import datetime
+import os
+import secrets
+import time
+from pathlib import Path
+from typing import Dict, Iterator, NamedTuple, Optional, Tuple
+
+from sqlalchemy import insert, tuple_
+from sqlalchemy.orm import Session
+
+from . import crud, jsonstore
+from . import models
+from .cache import bump
+from .manager import AgendaManager, journal_path
+from .db import Evenement, Matiere, User, SessionLocal, init_db
+
+BATCH_SIZE = 5000
+
+
+class TransferStats(NamedTuple):
+    matieres: int
+    evenements: int
+    ignores: int
+    secondes: float
+
+    @property
+    def rows_per_sec(self) -> float:
+        return (self.matieres + self.evenements + self.ignores) / self.secondes if self.secondes else 0.0
+
+
+def _iter_source(path: Path) -> Tuple[list, Iterator[Tuple[Dict, str, str, str]]]:
+    """(matieres, événements) d'un fichier v1 ou v2 ; un événement = (matiere, debut, fin, description)."""
+    if journal_path(path).exists():
+        # les opérations du journal désignent les événements par index : il faut
+        # tout l'état en mémoire pour les rejouer
+        manager = AgendaManager(str(path))
+        matieres = [m.to_dict() for m in manager.matieres]
+        events = ((e.matiere.to_dict(), e.date_debut.isoformat(), e.date_fin.isoformat(), e.description)
+                  for e in manager.evenements)
+        return matieres, events
+    try:
+        items = jsonstore.iter_snapshot(path)
+        header = next(items)
+    except ValueError:
+        matieres = list(jsonstore.iter_array(path, "matieres"))
+        events = ((e["matiere"], e["date_debut"], e["date_fin"], e.get("description", ""))
+                  for e in jsonstore.iter_array(path, "evenements"))
+        return matieres, events
+    par_id = header["objets"]
+    matieres = [m.to_dict() for m in par_id.values()]
+    events = ((e.matiere.to_dict(), e.date_debut.isoformat(), e.date_fin.isoformat(), e.description)
+              for e in items)
+    return matieres, events
+
+
+class _Resolver:
+    """Résout professeurs et matières en identifiants, avec cache."""
+
+    def __init__(self, db: Session, create_profs: bool):
+        self.db = db
+        self.create_profs = create_profs
+        self.profs: Dict[str, Optional[int]] = {}
+        for user in db.query(User).filter(User.role == "prof"):
+            for name in (user.username, user.full_name):
+                if name:
+                    self.profs.setdefault(name.strip().lower(), user.id)
+        self.matieres: Dict[Tuple[str, Optional[int]], int] = {
+            (m.nom, m.professeur_id): m.id for m in db.query(Matiere).order_by(Matiere.id)
+        }
+        self.created = 0
+
+    def professeur_id(self, name: str) -> Optional[int]:
+        key = (name or "").strip().lower()
+        if not key:
+            return None
+        if key not in self.profs:
+            prof_id = None
+            if self.create_profs:
+                username = key.replace(" ", ".")
+                while self.db.query(User.id).filter(User.username == username).first():
+                    username += "_"
+                # mot de passe aléatoire : l'administrateur doit le redéfinir
+                prof_id = crud.create_user(self.db, username, secrets.token_urlsafe(16), "prof",
+                                           full_name=name.strip()).id
+                print(f"[transfer] Created prof user '{username}' for '{name}'")
+            else:
+                print(f"[transfer] No prof user matches '{name}'; matières left without professeur")
+            self.profs[key] = prof_id
+        return self.profs[key]
+
+    def matiere_id(self, data: Dict) -> int:
+        prof_id = self.professeur_id(data.get("professeur"))
+        key = (data["nom"], prof_id)
+        if key not in self.matieres:
+            matiere = Matiere(nom=data["nom"], professeur_id=prof_id, salle=data.get("salle"),
+                              couleur=data.get("couleur", "#3498db"))
+            self.db.add(matiere)
+            self.db.flush()
+            self.matieres[key] = matiere.id
+            self.created += 1
+        return self.matieres[key]
+
+
+def _insert_batch(db: Session, batch: list) -> int:
+    """Insère les événements du lot absents de la base ; renvoie le nombre inséré."""
+    keys = list({(r["matiere_id"], r["date_debut"], r["date_fin"]) for r in batch})
+    existing = set()
+    # par tranches : SQLite limite le nombre de paramètres d'une requête
+    for i in range(0, len(keys), 1000):
+        existing.update(
+            (matiere_id, debut, fin, description or "")
+            for matiere_id, debut, fin, description in db.query(
+                Evenement.matiere_id, Evenement.date_debut, Evenement.date_fin, Evenement.description
+            ).filter(tuple_(Evenement.matiere_id, Evenement.date_debut, Evenement.date_fin).in_(keys[i:i + 1000]))
+        )
+    rows, seen = [], set()
+    for r in batch:
+        key = (r["matiere_id"], r["date_debut"], r["date_fin"], r["description"])
+        if key not in existing and key not in seen:
+            seen.add(key)
+            rows.append(r)
+    if rows:
+        db.execute(insert(Evenement), rows)
+    db.commit()
+    return len(rows)
+
+
+def import_json(db: Session, path, batch_size: int = BATCH_SIZE, create_profs: bool = False) -> TransferStats:
+    start = time.perf_counter()
+    matieres, events = _iter_source(Path(path))
+    resolver = _Resolver(db, create_profs)
+    for data in matieres:
+        resolver.matiere_id(data)
+    db.commit()
+
+    inserted = total = 0
+    batch = []
+    for matiere, debut, fin, description in events:
+        batch.append({
+            "matiere_id": resolver.matiere_id(matiere),
+            "date_debut": datetime.datetime.fromisoformat(debut),
+            "date_fin": datetime.datetime.fromisoformat(fin),
+            "description": description or "",
+        })
+        if len(batch) >= batch_size:
+            inserted += _insert_batch(db, batch)
+            total += len(batch)
+            batch = []
+            print(f"[transfer] {total} événements lus ({total / (time.perf_counter() - start):.0f}/s)")
+    if batch:
+        inserted += _insert_batch(db, batch)
+        total += len(batch)
+    bump("matieres", "evenements")
+    return TransferStats(resolver.created, inserted, total - inserted, time.perf_counter() - start)
+
+
+def export_json(db: Session, path, batch_size: int = BATCH_SIZE) -> TransferStats:
+    """Écrit la base au format v2 (fichier temporaire puis renommage atomique)."""
+    start = time.perf_counter()
+    matieres: Dict[int, models.Matiere] = {}
+    for m, username, full_name in (db.query(Matiere, User.username, User.full_name)
+                                   .outerjoin(User, Matiere.professeur_id == User.id).order_by(Matiere.id)):
+        matieres[m.id] = models.Matiere(m.nom, full_name or username or "", m.salle or "", m.couleur or "#3498db")
+    counter = [0]
+
+    def events():
+        query = (db.query(Evenement.matiere_id, Evenement.date_debut, Evenement.date_fin, Evenement.description)
+                 .order_by(Evenement.date_debut).yield_per(batch_size))
+        for matiere_id, debut, fin, description in query:
+            counter[0] += 1
+            yield models.Evenement(matieres[matiere_id], debut, fin, description or "")
+
+    path = Path(path)
+    tmp = path.with_name(path.name + ".tmp")
+    with tmp.open("wb") as f:
+        jsonstore.write_snapshot(f, list(matieres.values()), events())
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp, path)
+    # journal_seq vaut 0 : un ancien journal serait rejoué sur les données exportées
+    journal_path(path).unlink(missing_ok=True)
+    return TransferStats(len(matieres), counter[0], 0, time.perf_counter() - start)
+
+
+if __name__ == "__main__":
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Transfert agenda_data.json <-> base SQL.")
+    parser.add_argument("direction", choices=("import", "export"))
+    parser.add_argument("path", nargs="?", default="agenda_data.json")
+    parser.add_argument("--batch", type=int, default=BATCH_SIZE, help="événements par transaction")
+    parser.add_argument("--create-profs", action="store_true",
+                        help="créer un compte prof pour chaque professeur inconnu (import)")
+    args = parser.parse_args()
+
+    init_db()
+    db = SessionLocal()
+    try:
+        if args.direction == "import":
+            stats = import_json(db, args.path, args.batch, args.create_profs)
+        else:
+            stats = export_json(db, args.path, args.batch)
+    finally:
+        db.close()
+    print(f"[transfer] {args.direction}: {stats.matieres} matière(s), {stats.evenements} événement(s)"
+          f"{f', {stats.ignores} déjà présent(s)' if stats.ignores else ''} "
+          f"en {stats.secondes:.1f} s ({stats.rows_per_sec:.0f} lignes/s)")
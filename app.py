@@ -1,24 +1,19 @@
+import time
+_RUN_STARTED = time.perf_counter()
+
 import streamlit as st
 import datetime
 import calendar
-import pandas as pd
-import uuid
-import os
-from pathlib import Path
-import io
-import wave
-import struct
-import math
-
-from agenda import crud
+
+from agenda import attachments, crud, export, sounds, startup, storage
 from agenda.db import SessionLocal
+from agenda.storage import MAX_UPLOAD_BYTES, UploadTooLarge, save_stream
+from agenda.periods import day_bounds, week_bounds, month_bounds
 
-st.set_page_config(page_title="Agenda Multi-users", page_icon="📚", layout="wide")
+startup.timings.start_run(_RUN_STARTED)
+startup.timings.mark("imports")
 
-# dossier de stockage des uploads
-BASE_DIR = Path(__file__).resolve().parent
-UPLOADS_DIR = BASE_DIR / "uploads"
-UPLOADS_DIR.mkdir(parents=True, exist_ok=True)
+st.set_page_config(page_title="Agenda Multi-users", page_icon="📚", layout="wide")
 
 
 def do_rerun():
@@ -43,38 +38,29 @@ def check_rerun_flag():
             pass
 
 
-def init_admin_if_missing(db):
-    admins = db.query(crud.User).filter(crud.User.role == "admin").all()
-    if not admins:
-        crud.create_user(db, "admin", "admin123", "admin", full_name="Admin par défaut")
-
-
-# --- utility: generate small beep WAV bytes (sine tone) ---
-def generate_beep_wav(duration_s=0.15, freq=880.0, volume=0.5, sample_rate=22050):
+def attachment_download(file_path: str, file_name: str, key: str, label: str = "Télécharger", size: int = None, mime: str = None):
     """
-    Génère un court wav (bytes) contenant une sinusoïde.
-    Utilisé pour la notification sonore.
+    Affiche un fichier joint sans le lire : seule la taille est connue au rendu
+    (colonne devoirs.file_size, ou un stat pour les anciens devoirs).
+    Le contenu n'est chargé (via le cache d'agenda.attachments) qu'après un clic.
     """
-    num_samples = int(duration_s * sample_rate)
-    buf = io.BytesIO()
-    # prepare raw frames in bytes
-    frames = bytearray()
-    for i in range(num_samples):
-        t = i / sample_rate
-        sample = volume * math.sin(2 * math.pi * freq * t)
-        # 16-bit PCM
-        val = int(sample * 32767.0)
-        frames += struct.pack('<h', val)
-
-    # write a proper WAV file
-    with wave.open(buf, 'wb') as wf:
-        wf.setnchannels(1)
-        wf.setsampwidth(2)  # 16-bit
-        wf.setframerate(sample_rate)
-        wf.writeframes(bytes(frames))
-
-    buf.seek(0)
-    return buf.read()
+    if size is None:
+        info = attachments.attachment_info(file_path, file_name)
+        if not info.exists:
+            st.error(f"Fichier introuvable: {file_name}")
+            return
+        size = info.size
+    ready_key = f"dl_ready_{key}"
+    if not st.session_state.get(ready_key):
+        if st.button(f"{label} {file_name} ({attachments.human_size(size)})", key=f"dl_prepare_{key}"):
+            st.session_state[ready_key] = True
+            do_rerun()
+        return
+    try:
+        data = attachments.read_bytes(file_path)
+        st.download_button(label=f"{label} {file_name}", data=data, file_name=file_name, mime=mime, key=f"dl_{key}")
+    except Exception as ex:
+        st.error("Erreur lecture fichier: " + str(ex))
 
 
 # ---------- Auth / forms ----------
@@ -100,78 +86,77 @@ def register_user_form(db, role="student"):
     username = st.text_input(f"Nom d'utilisateur ({role})", key=f"reg_{role}_user")
     password = st.text_input("Mot de passe", type="password", key=f"reg_{role}_pwd")
     full_name = st.text_input("Nom complet", key=f"reg_{role}_name")
+    classe_id = None
+    if role == "student":
+        class_options = [f"{c.id}:{c.nom}" for c in crud.list_classes(db)]
+        class_sel = st.selectbox("Classe (optionnel)", [""] + class_options, key=f"reg_{role}_classe")
+        classe_id = int(class_sel.split(":")[0]) if class_sel else None
     if st.button(f"Créer {role}"):
         if username and password:
             existing = crud.get_user_by_username(db, username)
             if existing:
                 st.error("Utilisateur déjà existant")
             else:
-                crud.create_user(db, username, password, role, full_name=full_name)
+                crud.create_user(db, username, password, role, full_name=full_name, classe_id=classe_id)
                 st.success(f"Utilisateur {username} créé avec rôle {role}")
                 do_rerun()
 
 
 # helpers events/devoirs/csv
 def events_for_date(db, date_obj: datetime.date):
-    return crud.list_evenements_for_date(db, date_obj)
+    start, end = day_bounds(date_obj)
+    return crud.cached_evenements_by_day(db, start, end)[date_obj]
 
 
 def events_for_week(db, reference_date: datetime.datetime):
-    debut_semaine = reference_date - datetime.timedelta(days=reference_date.weekday())
-    week = []
-    for i in range(7):
-        jour = debut_semaine + datetime.timedelta(days=i)
-        evs = events_for_date(db, jour.date())
-        week.append({"date": jour, "evenements": sorted(evs, key=lambda x: x.date_debut)})
-    return week
+    start, end = week_bounds(reference_date)
+    by_day = crud.cached_evenements_by_day(db, start, end)
+    return [{"date": datetime.datetime.combine(jour, datetime.time.min), "evenements": evs} for jour, evs in by_day.items()]
 
 
 def events_for_month(db, year: int, month: int):
-    cal = calendar.monthcalendar(year, month)
-    events_mois = {}
-    for semaine in cal:
-        for day in semaine:
-            if day != 0:
-                date = datetime.date(year, month, day)
-                events_mois[day] = events_for_date(db, date)
-    return events_mois
-
-
-def search_events(db, query: str):
-    q = query.lower()
-    all_events = db.query(crud.Evenement).join(crud.Matiere).join(crud.User, isouter=True).all()
-    results = []
-    for e in all_events:
-        mat = e.matiere
-        prof = mat.professeur_obj.username if mat.professeur_obj else ""
-        if q in (mat.nom or "").lower() or q in (prof or "").lower() or q in (e.description or "").lower():
-            results.append(e)
-    return results
-
-
-def export_events_csv_for_user(db, user_id: int):
-    # export events visible to the user (for now all events); you can restrict by class later
-    events = crud.list_evenements_all(db)
-    if not events:
-        return None
-    rows = []
-    for e in events:
-        rows.append({
-            "Matière": e.matiere.nom,
-            "Professeur": e.matiere.professeur_obj.username if e.matiere.professeur_obj else "",
-            "Salle": e.salle or e.matiere.salle or "",
-            "Date Début": e.date_debut.strftime("%Y-%m-%d %H:%M"),
-            "Date Fin": e.date_fin.strftime("%Y-%m-%d %H:%M"),
-            "Description": e.description or ""
-        })
-    df = pd.DataFrame(rows)
-    return df.to_csv(index=False).encode('utf-8')
+    start, end = month_bounds(year, month)
+    by_day = crud.cached_evenements_by_day(db, start, end)
+    return {jour.day: evs for jour, evs in by_day.items()}
+
+
+SEARCH_PAGE_SIZE = 20
+NOTIF_PAGE_SIZE = 50
+
+
+def search_events(db, query: str, page: int = 1):
+    return crud.search_evenements(db, query, limit=SEARCH_PAGE_SIZE, offset=(page - 1) * SEARCH_PAGE_SIZE)
+
+
+def export_panel(db):
+    """Export CSV / iCalendar : généré seulement après un clic, puis servi depuis le cache."""
+    with st.expander("📤 Exporter mon emploi du temps"):
+        fmt = st.radio("Format", ["csv", "ics"], format_func=lambda f: "CSV" if f == "csv" else "iCalendar (.ics)", horizontal=True, key="export_fmt")
+        whole_history = st.checkbox("Toute la période", value=False, key="export_all")
+        start = end = None
+        if not whole_history:
+            today = datetime.date.today()
+            periode = st.date_input("Période", value=(today - datetime.timedelta(days=30), today + datetime.timedelta(days=180)), key="export_period")
+            if isinstance(periode, (list, tuple)) and len(periode) == 2:
+                start = datetime.datetime.combine(periode[0], datetime.time.min)
+                end = datetime.datetime.combine(periode[1], datetime.time.min) + datetime.timedelta(days=1)
+        classes = crud.list_classes(db)
+        class_sel = st.selectbox("Classe", [""] + [f"{c.id}:{c.nom}" for c in classes], format_func=lambda v: v.split(":", 1)[1] if v else "Toutes", key="export_classe")
+        classe_id = int(class_sel.split(":")[0]) if class_sel else None
+        params = (fmt, start, end, classe_id)
+        if st.button("Préparer l'export", key="export_prepare"):
+            st.session_state["export_params"] = params
+        if st.session_state.get("export_params") == params:
+            data = export.export_bytes(db, fmt, start, end, classe_id)
+            mime, file_name = export.FORMATS[fmt]
+            st.download_button(f"Télécharger ({fmt.upper()})", data=data, file_name=file_name, mime=mime, key="export_download")
 
 
 def main():
+    # schéma + admin par défaut : une seule fois par processus, pas à chaque rerun
+    startup.ensure_ready()
     db = SessionLocal()
     try:
-        init_admin_if_missing(db)
         check_rerun_flag()
 
         st.session_state.setdefault("user_id", None)
@@ -197,8 +182,7 @@ def main():
             do_rerun()
 
         # Notifications (anciennement Messages) preview
-        notifs = crud.list_messages_for_user(db, user_id)
-        unread = sum(1 for m in notifs if not m.read)
+        unread = crud.cached_unread_count(db, user_id)
         if st.sidebar.button(f"Notifications ({unread})"):
             st.session_state.view = "notifications"
             do_rerun()
@@ -242,6 +226,25 @@ def main():
                     register_user_form(db, role="prof")
                 with st.expander("Créer Élève"):
                     register_user_form(db, role="student")
+                with st.expander("Affecter un élève à une classe"):
+                    students = crud.list_students(db)
+                    classes = crud.list_classes(db)
+                    if not students or not classes:
+                        st.info("Il faut au moins un élève et une classe.")
+                    else:
+                        with st.form("assign_classe_form"):
+                            classe_names = {c.id: c.nom for c in classes}
+                            student = st.selectbox(
+                                "Élève", students, key="assign_student",
+                                format_func=lambda u: f"{u.username} ({classe_names.get(u.classe_id, 'sans classe')})",
+                            )
+                            class_sel = st.selectbox("Classe", [""] + [f"{c.id}:{c.nom}" for c in classes],
+                                                     format_func=lambda v: v.split(":", 1)[1] if v else "Aucune",
+                                                     key="assign_classe")
+                            if st.form_submit_button("Enregistrer"):
+                                crud.set_user_classe(db, student.id, int(class_sel.split(":")[0]) if class_sel else None)
+                                st.success("Classe mise à jour")
+                                do_rerun()
 
                 st.markdown("---")
                 st.subheader("📚 Matières")
@@ -260,7 +263,7 @@ def main():
                     if st.form_submit_button("Créer Matière"):
                         crud.create_matiere(db, nom, prof_id, salle, couleur, classe_id)
                         st.success("Matière créée")
-                        crud.notify_students(db, "Nouvelle matière", f"La matière {nom} a été créée", from_user_id=user_id)
+                        crud.notify_students(db, "Nouvelle matière", f"La matière {nom} a été créée", from_user_id=user_id, classe_id=classe_id)
                         do_rerun()
 
             with colB:
@@ -286,9 +289,11 @@ def main():
         elif role == "prof":
             st.header("🧑‍🏫 Panneau Professeur")
             st.subheader("Mes matières et actions")
-            my_matieres = db.query(crud.Matiere).filter(crud.Matiere.professeur_id == user_id).all()
+            my_matieres = crud.list_matieres_for_professeur(db, user_id)
 
             if my_matieres:
+                # compteurs de réponses pour toutes mes matières en une requête
+                attendance_summary = crud.get_attendance_counts_for_professeur(db, user_id)
                 for m in my_matieres:
                     st.markdown(f"<div style='background:{m.couleur}20;padding:12px;border-radius:10px;border-left:6px solid {m.couleur};'><h4>📘 {m.nom}</h4><p>🏫 {m.salle or '—'}</p></div>", unsafe_allow_html=True)
                     cols = st.columns([2, 1])
@@ -304,7 +309,7 @@ def main():
                                 dt_deb = datetime.datetime.combine(date, hdeb)
                                 dt_fin = datetime.datetime.combine(date, hfin)
                                 ev = crud.add_evenement(db, m.id, dt_deb, dt_fin, desc, creator_id=user_id, salle=salle_evt or None)
-                                crud.notify_students(db, f"Nouveau cours: {m.nom}", f"Un nouveau cours pour {m.nom} a été ajouté: {dt_deb.strftime('%Y-%m-%d %H:%M')} (Salle: {salle_evt or m.salle or '—'})", from_user_id=user_id)
+                                crud.notify_students(db, f"Nouveau cours: {m.nom}", f"Un nouveau cours pour {m.nom} a été ajouté: {dt_deb.strftime('%Y-%m-%d %H:%M')} (Salle: {salle_evt or m.salle or '—'})", from_user_id=user_id, matiere_id=m.id)
                                 st.success("Événement ajouté et notification envoyée")
                                 do_rerun()
 
@@ -318,16 +323,20 @@ def main():
                                 if date_remise:
                                     dt_rem = datetime.datetime.combine(date_remise, datetime.time(23, 59))
                                 file_name = None
-                                file_path = None
+                                stored = None
                                 if uploaded_file is not None:
-                                    unique_name = f"{uuid.uuid4().hex}_{uploaded_file.name}"
-                                    target_path = UPLOADS_DIR / unique_name
-                                    with open(target_path, "wb") as f:
-                                        f.write(uploaded_file.getbuffer())
+                                    if MAX_UPLOAD_BYTES and uploaded_file.size > MAX_UPLOAD_BYTES:
+                                        st.error(f"Fichier trop volumineux (max {MAX_UPLOAD_BYTES // (1024 * 1024)} Mo)")
+                                        st.stop()
+                                    # écriture par blocs, stockage dédupliqué : un fichier déjà posté n'est pas réécrit
+                                    try:
+                                        stored = save_stream(uploaded_file, name=uploaded_file.name, mime_type=uploaded_file.type)
+                                    except UploadTooLarge as ex:
+                                        st.error(str(ex))
+                                        st.stop()
                                     file_name = uploaded_file.name
-                                    file_path = str(target_path)
-                                d = crud.add_devoir(db, m.id, titre, desc, dt_rem, creator_id=user_id, file_name=file_name, file_path=file_path)
-                                crud.notify_students(db, f"Nouveau devoir: {titre}", f"Un nouveau devoir pour {m.nom} a été publié: {titre}", from_user_id=user_id)
+                                d = crud.add_devoir(db, m.id, titre, desc, dt_rem, creator_id=user_id, file_name=file_name, stored_file=stored)
+                                crud.notify_students(db, f"Nouveau devoir: {titre}", f"Un nouveau devoir pour {m.nom} a été publié: {titre}", from_user_id=user_id, matiere_id=m.id)
                                 st.success("Devoir ajouté et notification envoyée")
                                 do_rerun()
                     with cols[1]:
@@ -335,40 +344,25 @@ def main():
                         evs = crud.list_evenements_for_matiere(db, m.id)
                         if evs:
                             for e in evs[:10]:
-                                atts = crud.get_attendance_for_event(db, e.id)
-                                counts = {"yes": 0, "no": 0, "maybe": 0}
-                                for a in atts:
-                                    counts[a.status] = counts.get(a.status, 0) + 1
+                                counts = attendance_summary.for_evenement(e.id)
                                 st.write(f"- {e.date_debut.strftime('%Y-%m-%d %H:%M')} → {e.date_fin.strftime('%H:%M')}: {e.description or '—'} (Salle: {e.salle or m.salle or '—'})")
                                 st.write(f"  Réponses: ✅{counts['yes']} ❌{counts['no']} ❓{counts['maybe']}")
-                                if atts:
-                                    st.markdown("  Détails:")
-                                    for a in atts:
-                                        usr = db.get(crud.User, a.user_id)
-                                        st.write(f"    - {usr.username} : {a.status}")
+                                if sum(counts.values()) and st.checkbox("Détails", key=f"ev_details_{e.id}"):
+                                    for a in crud.list_attendees(db, evenement_id=e.id):
+                                        st.write(f"    - {a.username} : {a.status}")
                         else:
                             st.write("Aucun événement")
                         dvs = crud.list_devoirs_for_matiere(db, m.id)
                         if dvs:
                             for d in dvs[:10]:
                                 st.write(f"- {d.titre} (remise: {d.date_remise.strftime('%Y-%m-%d') if d.date_remise else '—'})")
-                                atts_d = crud.get_attendance_for_devoir(db, d.id)
-                                counts_d = {"yes": 0, "no": 0, "maybe": 0}
-                                for a in atts_d:
-                                    counts_d[a.status] = counts_d.get(a.status, 0) + 1
+                                counts_d = attendance_summary.for_devoir(d.id)
                                 st.write(f"  Réponses: ✅{counts_d['yes']} ❌{counts_d['no']} ❓{counts_d['maybe']}")
-                                if atts_d:
-                                    st.markdown("  Détails:")
-                                    for a in atts_d:
-                                        usr = db.get(crud.User, a.user_id)
-                                        st.write(f"    - {usr.username} : {a.status}")
-                                if d.file_path:
-                                    try:
-                                        with open(d.file_path, "rb") as f:
-                                            bytesf = f.read()
-                                        st.download_button(label=f"Télécharger {d.file_name}", data=bytesf, file_name=d.file_name)
-                                    except Exception as ex:
-                                        st.error("Erreur lecture fichier: " + str(ex))
+                                if sum(counts_d.values()) and st.checkbox("Détails", key=f"dv_details_{d.id}"):
+                                    for a in crud.list_attendees(db, devoir_id=d.id):
+                                        st.write(f"    - {a.username} : {a.status}")
+                                if d.file_path or d.blob_sha256:
+                                    attachment_download(storage.devoir_file(d.file_path, d.blob_sha256), d.file_name, key=f"prof_dv_{d.id}", size=d.file_size, mime=d.mime_type)
                         else:
                             st.write("Aucun devoir")
             else:
@@ -390,9 +384,7 @@ def main():
                 if st.button("🔄 Actualiser", key="stu_refresh"):
                     do_rerun()
             with col_nav3:
-                csv_bytes = export_events_csv_for_user(db, user_id)
-                if csv_bytes:
-                    st.download_button("Télécharger mon emploi du temps (CSV)", data=csv_bytes, file_name="emploi_du_temps.csv", mime="text/csv")
+                export_panel(db)
 
             if 'stu_date_courante' not in st.session_state:
                 st.session_state['stu_date_courante'] = datetime.datetime.now()
@@ -416,6 +408,18 @@ def main():
                         do_rerun()
 
                 evenements_semaine = events_for_week(db, st.session_state['stu_date_courante'])
+                week_event_ids = [e.id for jd in evenements_semaine for e in jd['evenements']]
+                week_status = crud.cached_attendance_map(db, user_id, event_ids=tuple(week_event_ids))
+                if week_event_ids:
+                    col_all1, col_all2 = st.columns([3, 1])
+                    with col_all1:
+                        choice_all = st.radio("Répondre à tous les cours de la semaine", options=["J'y vais", "Je n'y vais pas", "Peut-être"], key="rsvp_week_all_radio", horizontal=True)
+                    with col_all2:
+                        if st.button("Répondre à tout", key="rsvp_week_all_submit"):
+                            mapping = {"J'y vais": "yes", "Je n'y vais pas": "no", "Peut-être": "maybe"}
+                            sel = mapping.get(choice_all, "maybe")
+                            crud.set_attendance_many(db, user_id, event_statuses={ev_id: sel for ev_id in week_event_ids})
+                            do_rerun()
                 cols = st.columns(7)
                 jours = ['Lundi', 'Mardi', 'Mercredi', 'Jeudi', 'Vendredi', 'Samedi', 'Dimanche']
                 for i, col in enumerate(cols):
@@ -424,19 +428,18 @@ def main():
                         st.subheader(f"**{jours[i]}**\n{jour_data['date'].strftime('%d/%m')}")
                         if jour_data['evenements']:
                             for event in jour_data['evenements']:
-                                att = crud.get_user_attendance_for_event(db, user_id, event.id)
-                                user_status = att.status if att else None
+                                user_status = week_status.get(event.id)
                                 with st.container():
                                     st.markdown(
                                         f"""
-                                        <div style='background-color: {event.matiere.couleur}20; 
+                                        <div style='background-color: {event.matiere_couleur}20; 
                                                     padding: 12px; border-radius: 8px; 
-                                                    border-left: 5px solid {event.matiere.couleur};
+                                                    border-left: 5px solid {event.matiere_couleur};
                                                     margin: 8px 0; font-size: 0.9em;'>
                                             <strong>🕒 {event.date_debut.strftime('%H:%M')}-{event.date_fin.strftime('%H:%M')}</strong><br>
-                                            <strong>{event.matiere.nom}</strong><br>
-                                            👨‍🏫 {event.matiere.professeur_obj.username if event.matiere.professeur_obj else '—'}<br>
-                                            🏫 {event.salle or event.matiere.salle or '—'}
+                                            <strong>{event.matiere_nom}</strong><br>
+                                            👨‍🏫 {event.professeur or '—'}<br>
+                                            🏫 {event.salle or event.matiere_salle or '—'}
                                         </div>
                                         """,
                                         unsafe_allow_html=True
@@ -459,24 +462,24 @@ def main():
                 st.header("📋 Emploi du temps du jour")
                 date_jour = st.date_input("Sélectionnez une date", value=datetime.datetime.now().date(), key="stu_date_jour_selector")
                 evenements_jour = events_for_date(db, date_jour)
+                day_status = crud.cached_attendance_map(db, user_id, event_ids=tuple(e.id for e in evenements_jour))
                 st.subheader(f"📅 {date_jour.strftime('%A %d %B %Y')}")
                 if evenements_jour:
                     for idx, event in enumerate(sorted(evenements_jour, key=lambda x: x.date_debut)):
-                        att = crud.get_user_attendance_for_event(db, user_id, event.id)
-                        user_status = att.status if att else None
+                        user_status = day_status.get(event.id)
                         with st.container():
                             col1, col2 = st.columns([4, 1])
                             with col1:
                                 st.markdown(
                                     f"""
-                                    <div style='background-color: {event.matiere.couleur}30; 
+                                    <div style='background-color: {event.matiere_couleur}30; 
                                                 padding: 20px; border-radius: 10px; 
-                                                border-left: 8px solid {event.matiere.couleur};
+                                                border-left: 8px solid {event.matiere_couleur};
                                                 margin: 15px 0;'>
-                                        <h4>📚 {event.matiere.nom}</h4>
+                                        <h4>📚 {event.matiere_nom}</h4>
                                         <p>🕒 <strong>Horaire:</strong> {event.date_debut.strftime('%H:%M')} - {event.date_fin.strftime('%H:%M')}</p>
-                                        <p>👨‍🏫 <strong>Professeur:</strong> {event.matiere.professeur_obj.username if event.matiere.professeur_obj else '—'}</p>
-                                        <p>🏫 <strong>Salle:</strong> {event.salle or event.matiere.salle or '—'}</p>
+                                        <p>👨‍🏫 <strong>Professeur:</strong> {event.professeur or '—'}</p>
+                                        <p>🏫 <strong>Salle:</strong> {event.salle or event.matiere_salle or '—'}</p>
                                         <p>📝 <strong>Description:</strong> {event.description or 'Aucune description'}</p>
                                     </div>
                                     """,
@@ -499,7 +502,7 @@ def main():
             # Matières & Devoirs (with RSVP for devoirs + download)
             with tab3:
                 st.header("📚 Matières & Devoirs")
-                matieres = crud.list_matieres(db)
+                matieres = crud.cached_matieres(db)
                 if matieres:
                     st.metric("Nombre total de matières", len(matieres))
                     for matiere in matieres:
@@ -513,7 +516,7 @@ def main():
                                                 border-left: 6px solid {matiere.couleur};
                                                 margin: 10px 0;'>
                                         <h4>📖 {matiere.nom}</h4>
-                                        <p>👨‍🏫 <strong>Professeur:</strong> {matiere.professeur_obj.username if matiere.professeur_obj else '—'}</p>
+                                        <p>👨‍🏫 <strong>Professeur:</strong> {matiere.professeur or '—'}</p>
                                         <p>🏫 <strong>Salle:</strong> {matiere.salle or '—'}</p>
                                     </div>
                                     """,
@@ -534,19 +537,19 @@ def main():
                             st.write(f"Professeur: {selected.professeur_obj.username if selected.professeur_obj else '—'}")
                             st.write(f"Salle: {selected.salle or '—'}")
                             st.write("Cours à venir :")
-                            evs = crud.list_evenements_for_matiere(db, selected.id)
+                            evs = crud.cached_evenements_for_matiere(db, selected.id)
                             if evs:
                                 for e in evs:
                                     st.write(f"- {e.date_debut.strftime('%Y-%m-%d %H:%M')} → {e.date_fin.strftime('%H:%M')} — {e.description or '—'} (Salle: {e.salle or selected.salle or '—'})")
                             else:
                                 st.info("Aucun cours programmé pour cette matière.")
                             st.write("Devoirs :")
-                            devoirs = crud.list_devoirs_for_matiere(db, selected.id)
+                            devoirs = crud.cached_devoirs_for_matiere(db, selected.id)
                             if devoirs:
+                                devoir_status = crud.cached_attendance_map(db, user_id, devoir_ids=tuple(d.id for d in devoirs))
                                 for d in devoirs:
                                     st.write(f"- {d.titre} — remise: {d.date_remise.strftime('%Y-%m-%d') if d.date_remise else '—'} — {d.description or '—'}")
-                                    att_d = crud.get_user_attendance_for_devoir(db, user_id, d.id)
-                                    user_status_d = att_d.status if att_d else None
+                                    user_status_d = devoir_status.get(d.id)
                                     keybase = f"dv_rsvp_{d.id}"
                                     choice = st.radio("Choix", options=["", "Je ferai", "Je ne ferai pas", "Peut-être"], key=keybase+"_radio", label_visibility="collapsed")
                                     if st.button("Envoyer", key=keybase+"_submit"):
@@ -556,13 +559,8 @@ def main():
                                         do_rerun()
                                     if user_status_d:
                                         st.caption(f"Votre réponse: {user_status_d}")
-                                    if d.file_path:
-                                        try:
-                                            with open(d.file_path, "rb") as f:
-                                                file_bytes = f.read()
-                                            st.download_button(label=f"Télécharger: {d.file_name}", data=file_bytes, file_name=d.file_name)
-                                        except Exception as ex:
-                                            st.error(f"Erreur lecture fichier: {ex}")
+                                    if d.file_path or d.blob_sha256:
+                                        attachment_download(storage.devoir_file(d.file_path, d.blob_sha256), d.file_name, key=f"stu_dv_{d.id}", label="Télécharger:", size=d.file_size, mime=d.mime_type)
                             else:
                                 st.info("Aucun devoir pour cette matière.")
                 else:
@@ -599,7 +597,7 @@ def main():
                                 if evenements_du_jour:
                                     st.markdown(f"<small>{len(evenements_du_jour)} cours</small>", unsafe_allow_html=True)
                                     for event in evenements_du_jour[:2]:
-                                        st.markdown(f"<div style='background-color: {event.matiere.couleur}30; padding: 2px; margin: 1px; border-radius: 3px; font-size: 0.7em;'>{event.matiere.nom}</div>", unsafe_allow_html=True)
+                                        st.markdown(f"<div style='background-color: {event.matiere_couleur}30; padding: 2px; margin: 1px; border-radius: 3px; font-size: 0.7em;'>{event.matiere_nom}</div>", unsafe_allow_html=True)
                                     if len(evenements_du_jour) > 2:
                                         st.markdown(f"<small>+{len(evenements_du_jour) - 2} de plus</small>", unsafe_allow_html=True)
                             else:
@@ -608,11 +606,12 @@ def main():
             # Search tab (unchanged)
             with tab5:
                 st.header("🔍 Recherche d'événements")
-                query = st.text_input("Rechercher un cours, professeur ou description")
+                query = st.text_input("Rechercher un cours, professeur ou description", placeholder="ex. Maths, Dupont, B12 — une partie de mot suffit (« ath »)")
                 if query:
-                    resultats = search_events(db, query)
+                    page = st.number_input("Page", min_value=1, value=1, step=1, key="stu_search_page")
+                    resultats = search_events(db, query, page=int(page))
                     if resultats:
-                        st.success(f"🔍 {len(resultats)} résultat(s) trouvé(s) pour '{query}'")
+                        st.success(f"🔍 {len(resultats)} résultat(s) pour '{query}' (page {int(page)})")
                         for event in resultats:
                             with st.container():
                                 st.markdown(f"<div style='background-color: {event.matiere.couleur}30; padding: 15px; border-radius: 8px; border-left: 6px solid {event.matiere.couleur}; margin: 10px 0;'><h4>📚 {event.matiere.nom}</h4><p>📅 <strong>Date:</strong> {event.date_debut.strftime('%d/%m/%Y')}</p><p>🕒 <strong>Horaire:</strong> {event.date_debut.strftime('%H:%M')} - {event.date_fin.strftime('%H:%M')}</p><p>👨‍🏫 <strong>Professeur:</strong> {event.matiere.professeur_obj.username if event.matiere.professeur_obj else '—'}</p><p>🏫 <strong>Salle:</strong> {event.salle or event.matiere.salle or '—'}</p><p>📝 <strong>Description:</strong> {event.description or 'Aucune description'}</p></div>", unsafe_allow_html=True)
@@ -625,16 +624,29 @@ def main():
         # Notifications view (formerly Messages) — sound + mark read
         if st.session_state.get("view") == "notifications":
             st.header("🔔 Notifications")
-            messages = crud.list_messages_for_user(db, user_id)
-            unread_msgs = [m for m in messages if not m.read]
+            # pagination par curseur : pile des curseurs des pages déjà vues
+            cursors = st.session_state.setdefault("notif_cursors", [])
+            messages = crud.cached_messages(db, user_id, before=cursors[-1] if cursors else None, limit=NOTIF_PAGE_SIZE)
             # play beep if there are unread notifications
-            if unread_msgs:
+            # le choix est conservé dans st.session_state["notif_sound"] ; le WAV est mémorisé par agenda.sounds
+            sound_choice = st.selectbox("Son de notification", sounds.available_sounds(), key="notif_sound")
+            if unread:
                 try:
-                    beep = generate_beep_wav()
+                    beep = sounds.sound_wav(sound_choice)
                     st.audio(beep, format="audio/wav")
                 except Exception:
                     # ignore audio errors; still show notifications visually
                     pass
+            col_all_read, col_del_read = st.columns(2)
+            with col_all_read:
+                if unread and st.button("Tout marquer lu", key="notif_mark_all"):
+                    crud.mark_messages_read(db, user_id)
+                    do_rerun()
+            with col_del_read:
+                if st.button("Supprimer les notifications lues", key="notif_delete_read"):
+                    crud.delete_messages(db, user_id, only_read=True)
+                    st.session_state["notif_cursors"] = []
+                    do_rerun()
             if not messages:
                 st.info("Aucune notification")
             else:
@@ -648,12 +660,23 @@ def main():
                             if st.button("Marquer lu", key=f"mark_read_{m.id}"):
                                 crud.mark_message_read(db, m.id)
                                 do_rerun()
+            col_prev, col_next = st.columns(2)
+            with col_prev:
+                if cursors and st.button("◀ Plus récentes", key="notif_prev"):
+                    cursors.pop()
+                    do_rerun()
+            with col_next:
+                if len(messages) == NOTIF_PAGE_SIZE and st.button("Plus anciennes ▶", key="notif_next"):
+                    cursors.append(crud.message_cursor(messages[-1]))
+                    do_rerun()
     finally:
         # always close DB session
         try:
             db.close()
         except Exception:
             pass
+        startup.timings.mark("render")
+        startup.timings.finish_run()
 
 
 if __name__ == "__main__":
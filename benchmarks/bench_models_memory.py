@@ -0,0 +1,112 @@
+"""
+Mémoire occupée par N événements gardés en mémoire par l'AgendaManager,
+selon la représentation :
+
+- "dict"     : classes sans __slots__ (ancienne version de agenda.models),
+               une copie de Matiere par événement comme au chargement v1 ;
+- "slots"    : agenda.models (__slots__, matières partagées) ;
+- "table"    : agenda.table.EventTable (colonnes int64 / int32).
+
+Mesure par tracemalloc (pic et taille retenue), plus le temps de construction.
+
+Usage:
+    python benchmarks/bench_models_memory.py [--events 100000] [--matieres 30]
+"""
+import argparse
+import datetime
+import gc
+import sys
+import time
+import tracemalloc
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+from agenda.models import Matiere, Evenement  # noqa: E402
+from agenda.table import EventTable  # noqa: E402
+
+START = datetime.datetime(2025, 9, 1, 8, 0)
+
+
+class DictMatiere:
+    def __init__(self, nom, professeur, salle, couleur="#3498db"):
+        self.nom = nom
+        self.professeur = professeur
+        self.salle = salle
+        self.couleur = couleur
+
+
+class DictEvenement:
+    def __init__(self, matiere, date_debut, date_fin, description=""):
+        self.matiere = matiere
+        self.date_debut = date_debut
+        self.date_fin = date_fin
+        self.description = description
+
+
+def source(nb_events: int, nb_matieres: int):
+    """Données brutes comme lues depuis le JSON (chaînes distinctes par événement)."""
+    for i in range(nb_events):
+        debut = START + datetime.timedelta(hours=i)
+        k = i % nb_matieres
+        yield (f"Matière {k}", f"Prof {k}", f"Salle {k}", "#3498db",
+               debut.isoformat(), (debut + datetime.timedelta(minutes=50)).isoformat(), "")
+
+
+def build_dict(rows, nb_matieres):
+    return [DictEvenement(DictMatiere(nom, prof, salle, couleur), datetime.datetime.fromisoformat(d),
+                          datetime.datetime.fromisoformat(f), desc)
+            for nom, prof, salle, couleur, d, f, desc in rows]
+
+
+def build_slots(rows, nb_matieres):
+    matieres = {}
+    out = []
+    for nom, prof, salle, couleur, d, f, desc in rows:
+        m = matieres.get((nom, prof))
+        if m is None:
+            m = matieres[(nom, prof)] = Matiere(nom, prof, salle, couleur)
+        out.append(Evenement(m, datetime.datetime.fromisoformat(d), datetime.datetime.fromisoformat(f), desc))
+    return out
+
+
+def build_table(rows, nb_matieres):
+    matieres = {}
+    table = EventTable()
+    for nom, prof, salle, couleur, d, f, desc in rows:
+        m = matieres.get((nom, prof))
+        if m is None:
+            m = matieres[(nom, prof)] = Matiere(nom, prof, salle, couleur)
+        table.append(m, datetime.datetime.fromisoformat(d), datetime.datetime.fromisoformat(f), desc)
+    return table
+
+
+def measure(name, builder, nb_events, nb_matieres):
+    rows = list(source(nb_events, nb_matieres))
+    gc.collect()
+    tracemalloc.start()
+    t0 = time.perf_counter()
+    data = builder(rows, nb_matieres)
+    elapsed = time.perf_counter() - t0
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del rows
+    print(f"{name:<6} retenu={current / 1e6:7.1f} Mo  pic={peak / 1e6:7.1f} Mo  "
+          f"par événement={current / nb_events:6.0f} o  construction={elapsed:5.2f} s")
+    return data
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--events", type=int, default=100_000)
+    parser.add_argument("--matieres", type=int, default=30)
+    args = parser.parse_args()
+    print(f"{args.events} événements, {args.matieres} matières")
+    for name, builder in (("dict", build_dict), ("slots", build_slots), ("table", build_table)):
+        data = measure(name, builder, args.events, args.matieres)
+        del data
+        gc.collect()
+
+
+if __name__ == "__main__":
+    main()
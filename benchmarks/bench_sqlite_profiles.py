@@ -0,0 +1,127 @@
+"""
+Benchmark lecture/écriture concurrentes sur SQLite, pour chaque profil
+de agenda.db.ENGINE_PROFILES (ex. 'legacy' vs 'wal').
+
+Simule plusieurs sessions Streamlit : N threads lisent la semaine courante en
+boucle pendant qu'un thread écrit des événements (un commit par écriture).
+
+Usage:
+    python benchmarks/bench_sqlite_profiles.py [--readers 4] [--seconds 5] [--events 5000]
+"""
+import argparse
+import datetime
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+sys.path.insert(0, str(Path(__file__).resolve().parents[1]))
+
+# bases du benchmark dans un dossier temporaire ; l'engine par défaut de agenda.db
+# y pointe aussi, pour qu'aucune connexion ne puisse atteindre la vraie agenda.db
+_TMP = tempfile.mkdtemp(prefix="agenda_bench_")
+os.environ["AGENDA_DATABASE_URL"] = f"sqlite:///{_TMP}/import.db"
+
+from sqlalchemy.orm import sessionmaker  # noqa: E402
+
+from agenda import crud  # noqa: E402
+from agenda.db import Base, ENGINE_PROFILES, make_engine  # noqa: E402
+from agenda.periods import week_bounds  # noqa: E402
+
+START = datetime.datetime(2025, 9, 1, 8, 0)
+
+
+def seed(Session, nb_events: int) -> int:
+    db = Session()
+    try:
+        prof = crud.create_user(db, "prof", "x", "prof")
+        mat = crud.create_matiere(db, "Maths", prof.id, "A1", "#3498db", None)
+        rows = [
+            crud.Evenement(matiere_id=mat.id, date_debut=START + datetime.timedelta(hours=i),
+                           date_fin=START + datetime.timedelta(hours=i, minutes=50), description=f"cours {i}")
+            for i in range(nb_events)
+        ]
+        db.add_all(rows)
+        db.commit()
+        return mat.id
+    finally:
+        db.close()
+
+
+def run_profile(profile: str, readers: int, seconds: float, nb_events: int):
+    path = Path(_TMP) / f"{profile}.db"
+    engine = make_engine(f"sqlite:///{path}", profile=profile)
+    Base.metadata.create_all(bind=engine)
+    Session = sessionmaker(bind=engine, autoflush=False, autocommit=False)
+    matiere_id = seed(Session, nb_events)
+
+    stop = threading.Event()
+    stats = {"reads": 0, "writes": 0, "errors": 0}
+    lock = threading.Lock()
+
+    def reader():
+        db = Session()
+        n = err = 0
+        while not stop.is_set():
+            ref = START + datetime.timedelta(days=random.randrange(nb_events // 24 or 1))
+            try:
+                crud.list_evenements_between(db, *week_bounds(ref))
+                db.rollback()  # termine la transaction de lecture comme une fin de rerun
+                n += 1
+            except Exception:
+                db.rollback()
+                err += 1
+        db.close()
+        with lock:
+            stats["reads"] += n
+            stats["errors"] += err
+
+    def writer():
+        db = Session()
+        n = err = 0
+        while not stop.is_set():
+            debut = START + datetime.timedelta(minutes=random.randrange(60 * 24 * 90))
+            try:
+                crud.add_evenement(db, matiere_id, debut, debut + datetime.timedelta(hours=1), "bench", None)
+                n += 1
+            except Exception:
+                db.rollback()
+                err += 1
+        db.close()
+        with lock:
+            stats["writes"] += n
+            stats["errors"] += err
+
+    threads = [threading.Thread(target=reader) for _ in range(readers)] + [threading.Thread(target=writer)]
+    t0 = time.perf_counter()
+    for t in threads:
+        t.start()
+    time.sleep(seconds)
+    stop.set()
+    for t in threads:
+        t.join()
+    elapsed = time.perf_counter() - t0
+    engine.dispose()
+    return stats["reads"] / elapsed, stats["writes"] / elapsed, stats["errors"]
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[1])
+    parser.add_argument("--readers", type=int, default=4)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument("--events", type=int, default=5000)
+    parser.add_argument("--profiles", nargs="*", default=list(ENGINE_PROFILES))
+    args = parser.parse_args()
+
+    print(f"{args.readers} lecteur(s) + 1 écrivain, {args.seconds:.0f} s, {args.events} événements initiaux")
+    print(f"{'profil':<10}{'lectures/s':>14}{'écritures/s':>14}{'erreurs':>10}")
+    for profile in args.profiles:
+        reads, writes, errors = run_profile(profile, args.readers, args.seconds, args.events)
+        print(f"{profile:<10}{reads:>14.1f}{writes:>14.1f}{errors:>10}")
+
+
+if __name__ == "__main__":
+    main()